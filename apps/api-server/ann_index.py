@@ -0,0 +1,277 @@
+"""
+Índice aproximado de vecinos más cercanos (IVF) para galerías grandes.
+
+Un índice de archivo invertido agrupa los embeddings en `nlist` clusters
+(k-means). Al buscar, solo se comparan los vectores de los `nprobe` clusters
+más cercanos a la consulta en vez de toda la galería:
+
+- `nprobe` bajo: más rápido, menor recall.
+- `nprobe = nlist`: equivalente a la búsqueda exacta.
+
+Para galerías chicas (cientos o pocos miles de personas) el escaneo lineal de
+`SearchEngine` sigue siendo la mejor opción, y también es el "ground truth" para
+medir el recall del índice aproximado.
+"""
+import copy
+import time
+
+import numpy as np
+
+from search_engine import SearchEngine
+
+INDEX_KINDS = ("flat", "ivf")
+
+
+def _squared_distances(vectors: np.ndarray, sq_norms: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Distancias al cuadrado (n, k) entre vectores y centroides con un solo GEMM"""
+    centroid_norms = np.einsum("ij,ij->i", centroids, centroids)
+    sq_dist = sq_norms[:, np.newaxis] - 2.0 * (vectors @ centroids.T) + centroid_norms[np.newaxis, :]
+    np.maximum(sq_dist, 0.0, out=sq_dist)
+    return sq_dist
+
+
+def kmeans(vectors: np.ndarray, k: int, iterations: int = 20, seed: int = 0) -> np.ndarray:
+    """K-means (Lloyd) en NumPy. Retorna los centroides (k, d) en float32."""
+    rng = np.random.default_rng(seed)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    k = min(k, len(vectors))
+
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    sq_norms = np.einsum("ij,ij->i", vectors, vectors)
+
+    for _ in range(iterations):
+        assignments = np.argmin(_squared_distances(vectors, sq_norms, centroids), axis=1)
+
+        counts = np.bincount(assignments, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, np.newaxis]
+
+        # Clusters vacíos: se reinician con vectores al azar
+        if empty.any():
+            centroids[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()), replace=False)]
+
+    return centroids
+
+
+class IVFIndex:
+    """
+    Índice IVF (inverted file) con búsqueda exacta dentro de los clusters visitados.
+
+    Los vectores de cada cluster se guardan contiguos, así visitar un cluster es
+    un producto matriz-vector sobre un bloque de memoria, sin copiar filas sueltas.
+
+    Args:
+        dimensions: Dimensión de los embeddings
+        nlist: Cantidad de clusters (centroides gruesos)
+        nprobe: Clusters a visitar por consulta (perilla recall/latencia)
+    """
+
+    def __init__(self, dimensions: int, nlist: int = 256, nprobe: int = 8):
+        self.dimensions = dimensions
+        self.nlist = nlist
+        self.nprobe = nprobe
+
+        self.centroids = None
+        self.list_ids = []  # list_ids[c] = posiciones (orden de inserción) de los vectores del cluster c
+        self.list_vectors = []  # list_vectors[c] = matriz (m, d) contigua del cluster c
+        self.list_sq_norms = []
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def nbytes(self) -> int:
+        """Memoria usada por el índice"""
+        return self.centroids.nbytes + sum(
+            ids.nbytes + vectors.nbytes + norms.nbytes
+            for ids, vectors, norms in zip(self.list_ids, self.list_vectors, self.list_sq_norms)
+        )
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, vectors: np.ndarray, iterations: int = 20, max_train_size: int | None = None, seed: int = 0):
+        """
+        Entrena los centroides con k-means. Para galerías grandes se entrena sobre
+        una muestra (por defecto 256 vectores por cluster), que es suficiente.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        max_train_size = max_train_size or self.nlist * 256
+
+        if len(vectors) > max_train_size:
+            rng = np.random.default_rng(seed)
+            vectors = vectors[rng.choice(len(vectors), size=max_train_size, replace=False)]
+
+        self.centroids = kmeans(vectors, self.nlist, iterations=iterations, seed=seed)
+        self.nlist = len(self.centroids)
+        self.list_ids = [np.empty(0, dtype=np.int64) for _ in range(self.nlist)]
+        self.list_vectors = [np.empty((0, self.dimensions), dtype=np.float32) for _ in range(self.nlist)]
+        self.list_sq_norms = [np.empty(0, dtype=np.float32) for _ in range(self.nlist)]
+        self._size = 0
+
+    def add(self, vectors: np.ndarray):
+        """Agrega vectores al índice sin reentrenar (sus posiciones continúan la numeración)"""
+        if not self.is_trained:
+            raise RuntimeError("El índice IVF debe entrenarse antes de agregar vectores")
+
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dimensions)
+        sq_norms = np.einsum("ij,ij->i", vectors, vectors)
+        assignments = np.argmin(_squared_distances(vectors, sq_norms, self.centroids), axis=1)
+        positions = self._size + np.arange(len(vectors))
+
+        # Solo se copian los clusters que reciben vectores nuevos
+        for cluster in np.unique(assignments):
+            mask = assignments == cluster
+            self.list_ids[cluster] = np.concatenate([self.list_ids[cluster], positions[mask]])
+            self.list_vectors[cluster] = np.ascontiguousarray(np.vstack([self.list_vectors[cluster], vectors[mask]]))
+            self.list_sq_norms[cluster] = np.concatenate([self.list_sq_norms[cluster], sq_norms[mask]])
+
+        self._size += len(vectors)
+
+    def extended(self, embeddings: np.ndarray, start: int) -> "IVFIndex":
+        """
+        Retorna un índice nuevo con las filas [start:] de `embeddings` agregadas.
+        Solo se copian los clusters que reciben vectores; el índice actual no se modifica.
+        """
+        index = copy.copy(self)
+        index.list_ids = list(self.list_ids)
+        index.list_vectors = list(self.list_vectors)
+        index.list_sq_norms = list(self.list_sq_norms)
+        index.add(embeddings[start:])
+        return index
+
+    def search(self, query, k: int = 1, nprobe: int | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Retorna (índices, distancias) de los k vectores más cercanos entre los
+        clusters visitados, ordenados de menor a mayor distancia.
+        """
+        if len(self) == 0 or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        query = np.asarray(query, dtype=np.float32).ravel()
+        if query.shape[0] != self.dimensions:
+            raise ValueError(f"Dimensiones no coinciden. Índice: {self.dimensions}, Query: {query.shape[0]}")
+
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        query_sq = float(query @ query)
+
+        # 1. Clusters más cercanos a la consulta
+        centroid_dist = _squared_distances(query[np.newaxis, :], np.array([query_sq], dtype=np.float32), self.centroids)[0]
+        probe = np.argpartition(centroid_dist, nprobe - 1)[:nprobe] if nprobe < self.nlist else np.arange(self.nlist)
+
+        # 2. Distancias exactas contra los vectores de esos clusters (un GEMV por cluster)
+        candidates = np.concatenate([self.list_ids[c] for c in probe])
+        if len(candidates) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        sq_dist = np.concatenate([
+            self.list_sq_norms[c] - 2.0 * (self.list_vectors[c] @ query) for c in probe
+        ]) + query_sq
+        np.maximum(sq_dist, 0.0, out=sq_dist)
+
+        k = min(k, len(candidates))
+        top = np.argpartition(sq_dist, k - 1)[:k] if k < len(candidates) else np.arange(len(candidates))
+        top = top[np.argsort(sq_dist[top], kind="stable")]
+
+        return candidates[top], np.sqrt(sq_dist[top])
+
+    def save(self, path: str):
+        np.savez(
+            path,
+            kind="ivf",
+            centroids=self.centroids,
+            nprobe=self.nprobe,
+            ids=np.concatenate(self.list_ids),
+            vectors=np.vstack(self.list_vectors),
+            list_sizes=np.array([len(ids) for ids in self.list_ids])
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        with np.load(path) as data:
+            centroids = data["centroids"]
+            index = cls(centroids.shape[1], nlist=len(centroids), nprobe=int(data["nprobe"]))
+            index.centroids = centroids
+            ids = data["ids"]
+            vectors = data["vectors"]
+            bounds = np.concatenate([[0], np.cumsum(data["list_sizes"])])
+
+        index.list_ids = [ids[bounds[c]:bounds[c + 1]] for c in range(index.nlist)]
+        index.list_vectors = [np.ascontiguousarray(vectors[bounds[c]:bounds[c + 1]]) for c in range(index.nlist)]
+        index.list_sq_norms = [np.einsum("ij,ij->i", v, v) for v in index.list_vectors]
+        index._size = len(ids)
+        return index
+
+
+def build_index(
+    embeddings: np.ndarray,
+    kind: str = "flat",
+    nlist: int = 256,
+    nprobe: int = 8,
+    min_size: int = 10000,
+    storage: str = "float32",
+    pq_m: int = 64,
+    rerank: int = 64
+):
+    """
+    Construye el índice de búsqueda para una matriz de embeddings.
+    Con `kind="ivf"`, galerías con menos de `min_size` vectores usan igual la
+    búsqueda exacta: entrenar clusters no conviene para pocos vectores.
+    `storage` (float32, float16 o pq) aplica a la búsqueda por fuerza bruta.
+    """
+    # Import local: quantization usa kmeans de este módulo
+    from quantization import build_compressed_index
+
+    if kind not in INDEX_KINDS:
+        raise ValueError(f"Tipo de índice inválido: {kind} (usar {', '.join(INDEX_KINDS)})")
+
+    if kind == "flat" or len(embeddings) < max(min_size, nlist):
+        return build_compressed_index(embeddings, storage, pq_m=pq_m, rerank=rerank)
+
+    index = IVFIndex(embeddings.shape[1], nlist=nlist, nprobe=nprobe)
+    index.train(embeddings)
+    index.add(embeddings)
+    return index
+
+
+def load_index(path: str):
+    """Carga un índice guardado con `save` (flat o ivf)"""
+    with np.load(path) as data:
+        kind = str(data["kind"])
+
+    return IVFIndex.load(path) if kind == "ivf" else SearchEngine.load(path)
+
+
+def evaluate_recall(index, embeddings: np.ndarray, queries: np.ndarray, k: int = 10) -> dict:
+    """
+    Compara un índice aproximado contra la búsqueda exacta: recall@k y latencia
+    promedio por consulta (ms) de cada uno. Útil para elegir `nprobe`.
+    """
+    exact = SearchEngine(embeddings)
+    hits = 0
+    index_time = 0.0
+    exact_time = 0.0
+
+    for query in queries:
+        start = time.perf_counter()
+        approx_ids, _ = index.search(query, k)
+        index_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        exact_ids, _ = exact.search(query, k)
+        exact_time += time.perf_counter() - start
+
+        hits += len(np.intersect1d(approx_ids, exact_ids))
+
+    total = max(1, len(queries))
+    return {
+        "recall_at_k": hits / (total * k),
+        "k": k,
+        "index_ms": 1000 * index_time / total,
+        "exact_ms": 1000 * exact_time / total
+    }
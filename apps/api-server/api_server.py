@@ -1,24 +1,46 @@
+import asyncio
 import base64
-import io
-import tempfile
+import dataclasses
+import functools
+import json
 import os
+import time
+from contextlib import asynccontextmanager
 import numpy as np
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Header, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel, Field
 from supabase import create_client, Client
 from PIL import Image
 from dotenv import load_dotenv
 
+from ann_index import build_index, evaluate_recall
+from batching import MicroBatcher
+from caching import TTLCache, content_key
+from cascade import CASCADE_MODES, CascadeStats, coarse_covers, coarse_decision
+from coarse_embedding import COARSE_COLUMN, COARSE_DIMENSIONS, FACE_RECOGNITION_AVAILABLE, compute_coarse_embedding
+from face_embedding import (
+    DEEPFACE_AVAILABLE, DETECTOR_BACKEND, MODEL_NAME, detect_face, detect_face_checked, detect_faces, embed_batch,
+    prepare_crops, warm_up
+)
+from face_tracking import FaceTracker
+from metrics import CONTENT_TYPE, Registry, RequestMetricsMiddleware, ServerTimingMiddleware
+from multi_sample import aggregate_embeddings, detect_primary_faces, select_samples
+from profiling import MemoryTracker, ProfilerBusy, SamplingProfiler, collapsed
+from quality_gate import LowQualityFace, QualityStats, QualityThresholds, passed_gate
+from gallery import ID_CHUNK_SIZE, Gallery, GalleryCache
+from health_check import DependencyCheck
+from image_decode import DecodeStats, decode_image
+from quantization import compare_storage_modes
+from inference_pool import InferencePool, InferenceQueueFull
+
 # Cargar variables de entorno desde .env
 load_dotenv()
 
 # DeepFace para embeddings de 512 dimensiones (Facenet512)
-try:
-    from deepface import DeepFace
-    DEEPFACE_AVAILABLE = True
-except ImportError:
-    DEEPFACE_AVAILABLE = False
+if not DEEPFACE_AVAILABLE:
     print("⚠️  ERROR: DeepFace no está instalado. Es requerido para este servidor.")
     print("   Instalar: pip install deepface")
 
@@ -31,7 +53,339 @@ if not SUPABASE_URL or not SUPABASE_KEY:
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
-app = FastAPI(title="Face Recognition API", description="API para matching facial con Supabase")
+# Galería en memoria (se refresca cada GALLERY_REFRESH_SECONDS; 0 desactiva el refresh periódico)
+GALLERY_REFRESH_SECONDS = float(os.getenv("GALLERY_REFRESH_SECONDS", "300"))
+
+# Refresh incremental: "delta" aplica solo los cambios desde el último refresh, "full" recarga la tabla.
+# En modo delta, cada GALLERY_FULL_REFRESH_EVERY refreshes se recarga todo igual (0 = nunca).
+# GALLERY_WATERMARK_COLUMN: columna que marca filas nuevas (usar "updated_at" si la tabla la mantiene).
+GALLERY_REFRESH_MODE = os.getenv("GALLERY_REFRESH_MODE", "delta")
+GALLERY_FULL_REFRESH_EVERY = int(os.getenv("GALLERY_FULL_REFRESH_EVERY", "12"))
+GALLERY_WATERMARK_COLUMN = os.getenv("GALLERY_WATERMARK_COLUMN", "created_at")
+
+# Token para endpoints de administración (header X-Admin-Token). Sin token, quedan deshabilitados.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Profiler de CPU por muestreo de /admin/profile/cpu: duración máxima de un perfil
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", "60"))
+cpu_profiler = SamplingProfiler()
+memory_tracker = MemoryTracker()
+
+# Índice de búsqueda: "flat" (exacto) o "ivf" (aproximado, para galerías de 100k+ personas)
+GALLERY_INDEX = os.getenv("GALLERY_INDEX", "flat")
+IVF_NLIST = int(os.getenv("IVF_NLIST", "256"))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "8"))
+IVF_MIN_SIZE = int(os.getenv("IVF_MIN_SIZE", "10000"))  # Por debajo de este tamaño se usa búsqueda exacta
+
+# Representación de los vectores para la búsqueda por fuerza bruta: "float32", "float16" o "pq"
+GALLERY_STORAGE = os.getenv("GALLERY_STORAGE", "float32")
+PQ_SUBSPACES = int(os.getenv("PQ_SUBSPACES", "64"))  # Bytes por persona con "pq"
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "64"))  # Candidatos re-ordenados con float32
+
+# Snapshot en disco (mmap compartido entre workers). GALLERY_SOURCE=snapshot: los workers solo leen
+# el snapshot; GALLERY_SNAPSHOT_WRITE=true: el worker que consulta Supabase lo actualiza en cada refresh.
+GALLERY_SNAPSHOT_PATH = os.getenv("GALLERY_SNAPSHOT_PATH")
+GALLERY_SOURCE = os.getenv("GALLERY_SOURCE", "supabase")
+GALLERY_SNAPSHOT_WRITE = os.getenv("GALLERY_SNAPSHOT_WRITE", "false").lower() in ("1", "true", "yes")
+
+# float16/pq re-ordenan contra la matriz float32: solo ahorran memoria si esa matriz es el mmap del
+# snapshot. Cargada desde Supabase queda en el heap y los códigos se sumarían a ella.
+if GALLERY_STORAGE != "float32" and GALLERY_SOURCE != "snapshot":
+    raise ValueError(f"GALLERY_STORAGE={GALLERY_STORAGE} requiere GALLERY_SOURCE=snapshot y GALLERY_SNAPSHOT_PATH")
+
+gallery_cache = GalleryCache(
+    supabase,
+    refresh_interval=GALLERY_REFRESH_SECONDS,
+    snapshot_path=GALLERY_SNAPSHOT_PATH,
+    source=GALLERY_SOURCE,
+    write_snapshot=GALLERY_SNAPSHOT_WRITE,
+    model_name=MODEL_NAME,
+    refresh_mode=GALLERY_REFRESH_MODE,
+    full_refresh_every=GALLERY_FULL_REFRESH_EVERY,
+    watermark_column=GALLERY_WATERMARK_COLUMN,
+    index_factory=functools.partial(
+        build_index,
+        kind=GALLERY_INDEX,
+        nlist=IVF_NLIST,
+        nprobe=IVF_NPROBE,
+        min_size=IVF_MIN_SIZE,
+        storage=GALLERY_STORAGE,
+        pq_m=PQ_SUBSPACES,
+        rerank=RERANK_CANDIDATES
+    )
+)
+
+# Matcher de /match: "fine" (solo Facenet512), "cascade" (128 dimensiones primero y Facenet512 solo
+# si el resultado es dudoso) o "coarse" (solo 128 dimensiones). cascade/coarse requieren face_recognition.
+MATCH_MODE = os.getenv("MATCH_MODE", "fine")
+if MATCH_MODE not in CASCADE_MODES:
+    raise ValueError(f"MATCH_MODE inválido: {MATCH_MODE} (usar {', '.join(CASCADE_MODES)})")
+if MATCH_MODE != "fine" and not FACE_RECOGNITION_AVAILABLE:
+    print(f"⚠️  MATCH_MODE={MATCH_MODE} requiere face_recognition; se usa 'fine'")
+    MATCH_MODE = "fine"
+
+COARSE_THRESHOLD = float(os.getenv("COARSE_THRESHOLD", "0.6"))  # Tolerancia usual de face_recognition
+COARSE_MARGIN = float(os.getenv("COARSE_MARGIN", "0.08"))  # Zona dudosa alrededor del umbral: decide Facenet512
+CASCADE_SHORTLIST = int(os.getenv("CASCADE_SHORTLIST", "10"))  # Candidatos que Facenet512 re-ordena
+
+# Galería de embeddings de 128 dimensiones (face_encoding_faceapi), solo si la cascada está activa
+coarse_gallery_cache = GalleryCache(
+    supabase,
+    refresh_interval=GALLERY_REFRESH_SECONDS,
+    dimensions=COARSE_DIMENSIONS,
+    refresh_mode=GALLERY_REFRESH_MODE,
+    full_refresh_every=GALLERY_FULL_REFRESH_EVERY,
+    watermark_column=GALLERY_WATERMARK_COLUMN,
+    embedding_columns=(COARSE_COLUMN,)
+) if MATCH_MODE != "fine" else None
+
+cascade_stats = CascadeStats()
+
+# Pool de inferencia: "thread" o "process", cantidad de workers y tareas en espera permitidas
+INFERENCE_EXECUTOR = os.getenv("INFERENCE_EXECUTOR", "thread")
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", str(os.cpu_count() or 1)))
+INFERENCE_MAX_QUEUE = int(os.getenv("INFERENCE_MAX_QUEUE", "32"))
+
+inference_pool = InferencePool(INFERENCE_EXECUTOR, workers=INFERENCE_WORKERS, max_queue=INFERENCE_MAX_QUEUE)
+
+# Micro-batching: caras que llegan dentro de BATCH_MAX_WAIT_MS se procesan juntas (hasta BATCH_MAX_SIZE)
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "5"))
+
+embedding_batcher = MicroBatcher(
+    embed_batch, inference_pool, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS
+)
+
+
+# Caché de embeddings por hash del archivo subido (0 entradas la desactiva)
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "1024"))
+EMBEDDING_CACHE_TTL_SECONDS = float(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", "600"))
+
+embedding_cache = TTLCache(max_entries=EMBEDDING_CACHE_SIZE, ttl_seconds=EMBEDDING_CACHE_TTL_SECONDS)
+
+# Lado mayor máximo (px) al decodificar imágenes subidas; los JPEG se decodifican ya reducidos (0 = sin límite)
+MAX_IMAGE_SIDE = int(os.getenv("MAX_IMAGE_SIDE", "1024"))
+
+decode_stats = DecodeStats()
+
+# Caché de perfiles (linkedin_content, discord, foto) por id: la galería solo guarda ids y vectores
+# y el perfil se trae después del match. Se invalida cuando el refresh de la galería ve cambios.
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "2048"))
+PROFILE_CACHE_TTL_SECONDS = float(os.getenv("PROFILE_CACHE_TTL_SECONDS", "300"))
+
+profile_cache = TTLCache(max_entries=PROFILE_CACHE_SIZE, ttl_seconds=PROFILE_CACHE_TTL_SECONDS)
+
+# Tope de candidatos en /match/topk, /match/samples y /search/topk: cada uno es un perfil a traer
+MAX_TOPK = int(os.getenv("MAX_TOPK", "50"))
+
+
+def invalidate_profiles(person_ids):
+    """Descarta los perfiles cacheados de las filas que cambiaron (todos si person_ids es None)"""
+    if person_ids is None:
+        profile_cache.clear()
+        return
+    for person_id in person_ids:
+        profile_cache.invalidate(person_id)
+
+
+gallery_cache.on_change = invalidate_profiles
+
+# Reconocimiento continuo por WebSocket: asociación de caras entre frames y cuándo recalcular el embedding
+TRACK_IOU_THRESHOLD = float(os.getenv("TRACK_IOU_THRESHOLD", "0.3"))
+TRACK_MAX_MISSED_FRAMES = int(os.getenv("TRACK_MAX_MISSED_FRAMES", "5"))
+TRACK_QUALITY_MARGIN = float(os.getenv("TRACK_QUALITY_MARGIN", "1.25"))
+
+# Recortes de cara por request en /match/crops
+MAX_CROPS_PER_REQUEST = int(os.getenv("MAX_CROPS_PER_REQUEST", "16"))
+
+# Control de calidad antes del embedding: caras movidas, chicas, mal iluminadas o de perfil
+# no llegan a Facenet512 (/match responde 422 con los motivos)
+QUALITY_GATE = os.getenv("QUALITY_GATE", "true").lower() in ("1", "true", "yes")
+quality_thresholds = QualityThresholds(
+    min_face_size=int(os.getenv("QUALITY_MIN_FACE_SIZE", "60")),
+    min_sharpness=float(os.getenv("QUALITY_MIN_SHARPNESS", "30")),
+    min_brightness=float(os.getenv("QUALITY_MIN_BRIGHTNESS", "40")),
+    max_brightness=float(os.getenv("QUALITY_MAX_BRIGHTNESS", "220")),
+    max_roll_degrees=float(os.getenv("QUALITY_MAX_ROLL_DEGREES", "25")),
+    max_yaw_offset=float(os.getenv("QUALITY_MAX_YAW_OFFSET", "0.2"))
+)
+quality_stats = QualityStats()
+
+# Muestras de /match/samples: frames por request, calidad mínima relativa a la mejor
+# muestra y distancia coseno a la mediana a partir de la cual una muestra es outlier
+MAX_SAMPLES_PER_REQUEST = int(os.getenv("MAX_SAMPLES_PER_REQUEST", "10"))
+SAMPLE_MIN_QUALITY_RATIO = float(os.getenv("SAMPLE_MIN_QUALITY_RATIO", "0.5"))
+SAMPLE_OUTLIER_DISTANCE = float(os.getenv("SAMPLE_OUTLIER_DISTANCE", "0.4"))
+
+# Chequeo periódico de Supabase en segundo plano: /ready reporta el último resultado sin consultar
+# la base en cada sonda. Con READY_REQUIRES_SUPABASE=true, /ready responde 503 si Supabase no responde
+# (por defecto no: /match funciona con la galería en memoria aunque la base esté caída).
+HEALTH_CHECK_INTERVAL_SECONDS = float(os.getenv("HEALTH_CHECK_INTERVAL_SECONDS", "15"))
+READY_REQUIRES_SUPABASE = os.getenv("READY_REQUIRES_SUPABASE", "false").lower() in ("1", "true", "yes")
+
+supabase_check = DependencyCheck(
+    "supabase",
+    lambda: supabase.table("known_people").select("id").limit(1).execute(),
+    interval=HEALTH_CHECK_INTERVAL_SECONDS
+)
+STARTED_AT = time.time()
+
+# Warm-up al iniciar: construye modelos, corre una inferencia de prueba y carga la galería
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+
+startup_state = {
+    "models_loaded": False,
+    "warmup_seconds": None,
+    "warmup_error": None
+}
+
+# Tareas de fondo lanzadas al iniciar: se guarda la referencia para que no las recolecte el GC
+# y se cancelan al apagar
+background_tasks = set()
+
+# Métricas para Prometheus (/metrics). Cada etapa lleva el modelo y el detector que la ejecutan
+# (vacíos si no aplican) y también se reporta en el header Server-Timing del request; el resto
+# del estado se lee recién cuando se piden las métricas.
+metrics_registry = Registry()
+stage_seconds = metrics_registry.stage_histogram(
+    "face_api_stage_seconds", "Duración de cada etapa de un request", ("stage", "model", "detector")
+)
+request_seconds = metrics_registry.histogram(
+    "face_api_request_seconds", "Duración total de cada request HTTP", ("method", "route", "status")
+)
+
+READ_STAGE = ("read", "", "")
+DETECT_STAGE = ("detect", "", DETECTOR_BACKEND)
+EMBED_STAGE = ("embed", MODEL_NAME, "")
+COARSE_EMBED_STAGE = ("embed", "face_recognition", "hog")
+SEARCH_STAGE = ("search", MODEL_NAME, "")
+COARSE_SEARCH_STAGE = ("search", "face_recognition", "")
+FETCH_STAGE = ("fetch_profiles", "", "")
+
+
+def gallery_sizes() -> dict:
+    sizes = {("fine",): len(gallery_cache.gallery)}
+    if coarse_gallery_cache is not None:
+        sizes[("coarse",)] = len(coarse_gallery_cache.gallery)
+    return sizes
+
+
+def cache_metric(field: str) -> dict:
+    return {(name,): cache.stats()[field] for name, cache in (("embeddings", embedding_cache), ("profiles", profile_cache))}
+
+
+metrics_registry.gauge("face_api_gallery_size", "Personas en la galería en memoria", gallery_sizes, ("gallery",))
+metrics_registry.gauge("face_api_gallery_generation", "Generación publicada de la galería", lambda: gallery_cache.status()["generation"])
+metrics_registry.gauge("face_api_cache_entries", "Entradas en cada caché", lambda: cache_metric("entries"), ("cache",))
+metrics_registry.gauge("face_api_cache_hit_ratio", "Proporción de aciertos de cada caché", lambda: cache_metric("hit_ratio"), ("cache",))
+metrics_registry.counter_callback("face_api_cache_hits_total", "Aciertos de cada caché", lambda: cache_metric("hits"), ("cache",))
+metrics_registry.counter_callback("face_api_cache_misses_total", "Fallos de cada caché", lambda: cache_metric("misses"), ("cache",))
+metrics_registry.gauge("face_api_inference_in_flight", "Tareas de inferencia ejecutándose o en cola", lambda: inference_pool.in_flight)
+metrics_registry.gauge("face_api_inference_queue_depth", "Tareas de inferencia esperando un worker", lambda: inference_pool.queue_depth)
+metrics_registry.gauge("face_api_batch_pending", "Caras esperando entrar a un batch de Facenet512", lambda: embedding_batcher.pending)
+metrics_registry.counter_callback(
+    "face_api_quality_rejected_total", "Caras descartadas por el control de calidad, por motivo",
+    lambda: {(reason,): count for reason, count in quality_stats.stats()["rejected_by_reason"].items()}, ("reason",)
+)
+metrics_registry.counter_callback(
+    "face_api_cascade_decisions_total", "Requests de /match en cascada por etapa que decidió",
+    lambda: {(outcome,): count for outcome, count in cascade_stats.stats()["decided_by"].items()}, ("outcome",)
+)
+metrics_registry.gauge("face_api_ready", "1 si los modelos y la galería están cargados", lambda: int(is_ready()))
+metrics_registry.gauge(
+    "face_api_dependency_up", "1 si el último chequeo de la dependencia respondió",
+    lambda: {("supabase",): None if supabase_check.ok is None else int(supabase_check.ok)}, ("dependency",)
+)
+
+
+async def sync_gallery_after_snapshot():
+    """Sincroniza con Supabase la galería abierta desde el snapshot (si falla, reintenta el refresh periódico)"""
+    try:
+        await run_in_threadpool(gallery_cache.refresh)
+    except Exception as e:
+        print(f"⚠️  No se pudo sincronizar la galería con Supabase: {e}")
+
+
+async def load_gallery_at_startup():
+    """
+    Si hay snapshot en disco lo abre primero (milisegundos) y sincroniza con
+    Supabase en segundo plano; si no, descarga la tabla antes de quedar listo.
+    """
+    if GALLERY_SNAPSHOT_PATH and GALLERY_SOURCE == "supabase":
+        try:
+            await run_in_threadpool(gallery_cache.load_snapshot)
+            task = asyncio.create_task(sync_gallery_after_snapshot())
+            background_tasks.add(task)
+            task.add_done_callback(background_tasks.discard)
+            return
+        except Exception as e:
+            print(f"⚠️  No se pudo abrir el snapshot {GALLERY_SNAPSHOT_PATH}: {e}")
+
+    await run_in_threadpool(gallery_cache.refresh)
+
+
+async def run_startup_warmup():
+    """Carga la galería y precalienta los modelos; /ready responde 503 hasta que termine"""
+    try:
+        await load_gallery_at_startup()
+    except Exception as e:
+        # El refresh periódico o /admin/gallery/refresh reintentan
+        print(f"⚠️  No se pudo cargar la galería al iniciar: {e}")
+
+    if coarse_gallery_cache is not None:
+        try:
+            await run_in_threadpool(coarse_gallery_cache.refresh)
+        except Exception as e:
+            print(f"⚠️  No se pudo cargar la galería de 128 dimensiones al iniciar: {e}")
+
+    if not DEEPFACE_AVAILABLE:
+        startup_state["warmup_error"] = "DeepFace no está instalado"
+        return
+
+    if not WARMUP_ON_STARTUP:
+        # Sin warm-up los modelos se cargan en el primer request
+        startup_state["models_loaded"] = True
+        return
+
+    try:
+        start = time.perf_counter()
+        await inference_pool.run_on_each_worker(warm_up)
+        startup_state["warmup_seconds"] = time.perf_counter() - start
+        startup_state["models_loaded"] = True
+        print(f"✅ Modelos precalentados en {startup_state['warmup_seconds']:.2f}s")
+    except Exception as e:
+        startup_state["warmup_error"] = str(e)
+        print(f"⚠️  Error en el warm-up de modelos: {e}")
+
+
+def is_ready() -> bool:
+    coarse_loaded = coarse_gallery_cache is None or coarse_gallery_cache.loaded
+    supabase_ok = not READY_REQUIRES_SUPABASE or supabase_check.ok is True
+    return startup_state["models_loaded"] and gallery_cache.loaded and coarse_loaded and supabase_ok
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Lanza el warm-up en segundo plano y arranca el refresh de la galería"""
+    embedding_batcher.start()
+    supabase_check.start()
+    warmup_task = asyncio.create_task(run_startup_warmup())
+    gallery_cache.start_background_refresh()
+    if coarse_gallery_cache is not None:
+        coarse_gallery_cache.start_background_refresh()
+    yield
+    warmup_task.cancel()
+    for task in list(background_tasks):
+        task.cancel()
+    await embedding_batcher.stop()
+    gallery_cache.stop_background_refresh()
+    if coarse_gallery_cache is not None:
+        coarse_gallery_cache.stop_background_refresh()
+    supabase_check.stop()
+    inference_pool.shutdown()
+
+
+app = FastAPI(title="Face Recognition API", description="API para matching facial con Supabase", lifespan=lifespan)
 
 # Configurar CORS
 app.add_middleware(
@@ -41,6 +395,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(ServerTimingMiddleware)
+app.add_middleware(RequestMetricsMiddleware, histogram=request_seconds)
 
 
 class ImageRequest(BaseModel):
@@ -48,6 +404,19 @@ class ImageRequest(BaseModel):
     threshold: float = 1.0  # Umbral por defecto para embeddings de 512 dimensiones (Facenet512)
 
 
+class FaceMatch(BaseModel):
+    box: list[int] | None = None  # x, y, ancho, alto en píxeles de la imagen decodificada
+    confidence: float | None = None
+    match_found: bool
+    id: int | str | None = None
+    person_name: str | None = None
+    distance: float | None = None
+    linkedin_content: str | None = None
+    discord_username: str | None = None
+    photo_path: str | None = None
+    reasons: list[str] | None = None  # Motivos del control de calidad si la cara no se embebió
+
+
 class MatchResponse(BaseModel):
     match_found: bool
     person_name: str | None = None
@@ -55,6 +424,49 @@ class MatchResponse(BaseModel):
     threshold: float
     linkedin_content: str | None = None
     message: str
+    faces: list[FaceMatch] | None = None  # Solo con multi_face=true: todas las caras detectadas
+    stage: str | None = None  # Con MATCH_MODE=cascade|coarse: etapa que decidió (ver /cascade/stats)
+
+
+class EmbeddingSearchRequest(BaseModel):
+    embedding: list[float]
+    k: int = Field(3, ge=1, le=MAX_TOPK)
+    threshold: float = 1.0
+    second_best_ratio: float = 0.75  # El mejor debe ser al menos 25% mejor que el segundo
+    exact: bool = False  # Forzar búsqueda exacta aunque la galería use un índice aproximado
+
+
+class Candidate(BaseModel):
+    id: int | str
+    person_name: str
+    distance: float
+    linkedin_content: str | None = None
+    discord_username: str | None = None
+    photo_path: str | None = None
+    label: str | None = None
+
+
+class TopKResponse(BaseModel):
+    match_found: bool
+    ambiguous: bool
+    person_name: str | None = None
+    distance: float | None = None
+    second_best_distance: float | None = None
+    threshold: float
+    second_best_ratio: float
+    candidates: list[Candidate]
+    message: str
+
+
+class SampleDiscard(BaseModel):
+    index: int
+    reason: str  # "no_face", "low_quality", "outlier" o el motivo del control de calidad ("blurry", "too_small"...)
+
+
+class MultiSampleResponse(TopKResponse):
+    samples_received: int
+    samples_used: int
+    discarded: list[SampleDiscard]
 
 
 def decode_base64_image(base64_string: str) -> Image.Image:
@@ -67,22 +479,77 @@ def decode_base64_image(base64_string: str) -> Image.Image:
         # Decodificar base64
         image_data = base64.b64decode(base64_string)
         
-        # Convertir a PIL Image
-        image = Image.open(io.BytesIO(image_data))
-        
-        # Convertir a RGB si es necesario (para PNG con transparencia)
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        return image
+        # Convertir a PIL Image (RGB, con el lado mayor acotado)
+        return load_image(image_data)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error al decodificar imagen base64: {str(e)}")
 
 
-def calculate_face_encoding(image: Image.Image) -> np.ndarray:
+def load_image(contents: bytes) -> Image.Image:
+    """
+    Decodifica los bytes de un archivo de imagen a RGB con el lado mayor acotado
+    a MAX_IMAGE_SIDE (los JPEG se decodifican directamente a escala reducida).
+    """
+    image, info = decode_image(contents, MAX_IMAGE_SIDE)
+    decode_stats.record(info)
+    stage_seconds.observe(info["decode_seconds"], "decode", "", "")
+    return image
+
+
+def low_quality_error(assessment: dict, **extra) -> HTTPException:
+    """422 con los motivos y las medidas del control de calidad (`extra` se agrega al detalle)"""
+    return HTTPException(
+        status_code=422,
+        detail={"message": str(LowQualityFace(assessment)), "reasons": assessment["reasons"], "scores": assessment["scores"], **extra}
+    )
+
+
+async def detect_face_for_embedding(image: Image.Image):
+    """
+    Detecta la cara a embeber en el pool de workers. Con QUALITY_GATE además la
+    evalúa y lanza LowQualityFace si no pasa (queda registrada en ambos casos).
+    """
+    if not QUALITY_GATE:
+        with stage_seconds.time(*DETECT_STAGE):
+            return await inference_pool.run(detect_face, image)
+
+    try:
+        with stage_seconds.time(*DETECT_STAGE):
+            face, assessment = await inference_pool.run(detect_face_checked, image, quality_thresholds)
+    except LowQualityFace as e:
+        record_quality(e.assessment)
+        raise
+    record_quality(assessment)
+    return face
+
+
+async def detect_gated_face(image: Image.Image):
+    """Cara que pasó el control de calidad, antes de correr cualquier modelo de embedding (422 si no pasa)"""
+    if not DEEPFACE_AVAILABLE:
+        raise HTTPException(
+            status_code=500,
+            detail="DeepFace no está instalado. Es requerido para el control de calidad de la cara."
+        )
+
+    try:
+        return await detect_face_for_embedding(image)
+    except LowQualityFace as e:
+        raise low_quality_error(e.assessment)
+    except InferenceQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error al procesar la imagen con DeepFace: {str(e)}")
+
+
+async def calculate_face_encoding(image: Image.Image, face=None) -> np.ndarray:
     """
     Calcula el encoding facial de una imagen usando DeepFace Facenet512 (512 dimensiones).
     Esto asegura consistencia con los embeddings guardados en la DB.
+    La detección corre en el pool de workers y el embedding se agrupa en batch
+    con otros requests concurrentes, sin bloquear el event loop.
+    Con `face` (ya detectada y evaluada) se saltea la detección.
     """
     if not DEEPFACE_AVAILABLE:
         raise HTTPException(
@@ -91,40 +558,525 @@ def calculate_face_encoding(image: Image.Image) -> np.ndarray:
         )
     
     try:
-        # Guardar imagen temporalmente para DeepFace
-        temp_dir = tempfile.gettempdir()
-        temp_path = os.path.join(temp_dir, f"temp_face_{os.getpid()}.jpg")
-        
-        # Guardar imagen como JPEG
-        image.save(temp_path, "JPEG")
-        
-        try:
-            # Calcular embedding con DeepFace Facenet512 (512 dimensiones)
-            result = DeepFace.represent(
-                img_path=temp_path,
-                model_name="Facenet512",  # Modelo de 512 dimensiones
-                enforce_detection=False,  # No fallar si no detecta cara claramente
-                detector_backend='opencv'  # Backend de detección
-            )
-            
-            if not result or len(result) == 0:
-                raise ValueError("No se detectó ninguna cara en la imagen")
-            
-            # Tomar el primer embedding (primera cara detectada)
-            embedding = result[0]['embedding']
-            
-            return np.array(embedding)
-        finally:
-            # Limpiar archivo temporal
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-                
+        if face is None:
+            face = await detect_face_for_embedding(image)
+
+        start = time.perf_counter()
+        encoding = await embedding_batcher.submit(face)
+        embed_seconds = time.perf_counter() - start
+        quality_stats.record_stage("embed", embed_seconds)
+        stage_seconds.observe(embed_seconds, *EMBED_STAGE)
+        return encoding
+    except LowQualityFace as e:
+        raise low_quality_error(e.assessment)
+    except InferenceQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error al procesar la imagen con DeepFace: {str(e)}")
 
 
+def record_quality(assessment: dict):
+    quality_stats.record(assessment)
+    stage_seconds.observe(assessment["seconds"], "quality", "", "")
+    if "detect_seconds" in assessment:
+        quality_stats.record_stage("detect", assessment["detect_seconds"])
+
+
+PROFILE_COLUMNS = "id, full_name, linkedin_content, discord_username, photo_path, label"
+
+
+async def embed_upload(file: UploadFile) -> np.ndarray:
+    """
+    Lee un archivo subido y retorna su embedding. Si los mismos bytes ya se
+    procesaron con el mismo modelo y detector, usa la caché y evita decode,
+    detección e inferencia.
+    """
+    with stage_seconds.time(*READ_STAGE):
+        contents = await file.read()
+    return await embed_contents(contents)
+
+
+async def embed_contents(contents: bytes, image: Image.Image | None = None, face=None) -> np.ndarray:
+    """
+    Embedding Facenet512 de los bytes de una imagen, con caché por contenido
+    (`image` evita decodificar de nuevo y `face`, detectar de nuevo).
+    """
+    cache_key = content_key(contents, MODEL_NAME, DETECTOR_BACKEND, str(MAX_IMAGE_SIDE))
+
+    cached = embedding_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    if image is None and face is None:
+        image = await run_in_threadpool(load_image, contents)
+    encoding = await calculate_face_encoding(image, face)
+
+    # Solo lectura: el mismo array se comparte entre requests
+    encoding.setflags(write=False)
+    embedding_cache.set(cache_key, encoding)
+    return encoding
+
+
+def fetch_people_details(person_ids: list) -> dict:
+    """
+    Obtiene los datos de perfil de varias personas, indexados por id. Los que no
+    están en `profile_cache` se traen en tandas de ID_CHUNK_SIZE y quedan cacheados.
+    """
+    details = {}
+    missing = []
+
+    for person_id in person_ids:
+        person = profile_cache.get(person_id)
+        if person is None:
+            missing.append(person_id)
+        else:
+            details[person_id] = person
+
+    if not missing:
+        return details
+
+    # En tandas: con muchos ids un solo `in_` supera el largo máximo de URL de PostgREST
+    try:
+        with stage_seconds.time(*FETCH_STAGE):
+            people = []
+            for start in range(0, len(missing), ID_CHUNK_SIZE):
+                chunk = missing[start:start + ID_CHUNK_SIZE]
+                response = supabase.table("known_people").select(PROFILE_COLUMNS).in_("id", chunk).execute()
+                people.extend(response.data or [])
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error al conectar con Supabase: {str(e)}"
+        )
+
+    for person in people:
+        profile_cache.set(person["id"], person)
+        details[person["id"]] = person
+
+    return details
+
+
+def fetch_person_details(person_id) -> dict:
+    """Obtiene los datos de perfil de una persona por id (vacío si no existe)"""
+    return fetch_people_details([person_id]).get(person_id, {})
+
+
+def rank_candidates(
+    target_encoding: np.ndarray, k: int, threshold: float, second_best_ratio: float, exact: bool = False
+) -> TopKResponse:
+    """
+    Busca los k vecinos más cercanos en la galería (una sola pasada) y decide si
+    el match es ambiguo: el mejor debe ser menor que `second_best_ratio` veces el segundo.
+    Con `exact=True` ignora el índice aproximado y recorre toda la galería.
+    """
+    if k < 1 or k > MAX_TOPK:
+        raise HTTPException(status_code=400, detail=f"k debe estar entre 1 y {MAX_TOPK}")
+
+    # La generación de la galería queda tomada solo durante la búsqueda: un refresh en curso no la bloquea
+    with gallery_cache.acquire() as gallery:
+        if len(gallery) == 0:
+            return TopKResponse(
+                match_found=False,
+                ambiguous=False,
+                threshold=threshold,
+                second_best_ratio=second_best_ratio,
+                candidates=[],
+                message="La base de datos está vacía"
+            )
+
+        # Siempre se buscan al menos 2 para poder verificar contra el segundo mejor
+        try:
+            with stage_seconds.time(*SEARCH_STAGE):
+                indices, distances = gallery.search(target_encoding, k=max(k, 2), exact=exact)
+        except ValueError as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+        people = [(gallery.ids[int(i)], gallery.names[int(i)]) for i in indices]
+
+    best_dist = float(distances[0])
+    second_dist = float(distances[1]) if len(distances) > 1 else None
+    ambiguous = second_dist is not None and best_dist >= second_best_ratio * second_dist
+    match_found = best_dist < threshold and not ambiguous
+
+    details = fetch_people_details([person_id for person_id, _ in people[:k]])
+
+    candidates = []
+    for (person_id, name), dist in zip(people[:k], distances[:k]):
+        person = details.get(person_id, {})
+        candidates.append(Candidate(
+            id=person_id,
+            person_name=name,
+            distance=float(dist),
+            linkedin_content=person.get("linkedin_content"),
+            discord_username=person.get("discord_username"),
+            photo_path=person.get("photo_path"),
+            label=person.get("label")
+        ))
+
+    best_match = people[0][1]
+
+    if match_found:
+        message = f"Match encontrado: {best_match}"
+    elif ambiguous and best_dist < threshold:
+        second_match = people[1][1]
+        message = f"Match ambiguo: {best_match} ({best_dist:.4f}) vs {second_match} ({second_dist:.4f})"
+    else:
+        message = f"No se encontró match. El más cercano fue {best_match} con distancia {best_dist:.4f}"
+
+    return TopKResponse(
+        match_found=match_found,
+        ambiguous=ambiguous,
+        person_name=best_match,
+        distance=best_dist,
+        second_best_distance=second_dist,
+        threshold=threshold,
+        second_best_ratio=second_best_ratio,
+        candidates=candidates,
+        message=message
+    )
+
+
+def identify_embeddings(encodings: np.ndarray, threshold: float) -> list:
+    """Persona más cercana para varios embeddings con una sola búsqueda matricial"""
+    with gallery_cache.acquire() as gallery:
+        if len(gallery) == 0:
+            return [{"match_found": False, "person_id": None, "person_name": None, "distance": None} for _ in encodings]
+
+        with stage_seconds.time(*SEARCH_STAGE):
+            neighbours = gallery.search_batch(encodings, k=1)
+
+        results = []
+        for indices, distances in neighbours:
+            best_index = int(indices[0])
+            results.append({
+                "match_found": float(distances[0]) < threshold,
+                "person_id": gallery.ids[best_index],
+                "person_name": gallery.names[best_index],
+                "distance": float(distances[0])
+            })
+        return results
+
+
+async def embed_coarse(contents: bytes, image: Image.Image) -> np.ndarray | None:
+    """Embedding de 128 dimensiones (con caché por contenido); None si face_recognition no encuentra cara"""
+    cache_key = content_key(contents, "face_recognition", COARSE_COLUMN, str(MAX_IMAGE_SIDE))
+
+    cached = embedding_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    try:
+        with stage_seconds.time(*COARSE_EMBED_STAGE):
+            encoding = await inference_pool.run(compute_coarse_embedding, image)
+    except InferenceQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except ValueError:
+        return None
+
+    encoding.setflags(write=False)
+    embedding_cache.set(cache_key, encoding)
+    return encoding
+
+
+def rerank_shortlist(gallery: Gallery, encoding: np.ndarray, shortlist_ids: list) -> tuple[int | None, float | None]:
+    """Mejor candidato Facenet512 entre las personas preseleccionadas: (posición, distancia)"""
+    positions = np.sort([position for position in map(gallery.position_of, shortlist_ids) if position is not None])
+    if len(positions) == 0:
+        return None, None
+
+    distances = np.linalg.norm(np.asarray(gallery.embeddings[positions], dtype=np.float32) - encoding, axis=1)
+    best = int(np.argmin(distances))
+    return int(positions[best]), float(distances[best])
+
+
+def search_coarse(encoding: np.ndarray) -> tuple[list, list, np.ndarray, bool]:
+    """
+    Lista corta de la etapa de 128 dimensiones: (ids, nombres, distancias, cobertura),
+    donde cobertura indica si todas las personas de la galería Facenet512 tienen vector de 128.
+    """
+    with coarse_gallery_cache.acquire() as coarse_gallery, gallery_cache.acquire() as gallery:
+        with stage_seconds.time(*COARSE_SEARCH_STAGE):
+            indices, distances = coarse_gallery.search(encoding, k=CASCADE_SHORTLIST)
+        ids = [coarse_gallery.ids[int(i)] for i in indices]
+        names = [coarse_gallery.names[int(i)] for i in indices]
+        return ids, names, distances, coarse_covers(coarse_gallery, gallery)
+
+
+def search_fine(encoding: np.ndarray, shortlist_ids: list, threshold: float):
+    """Facenet512 sobre la lista corta y, si ahí no hay match, sobre toda la galería (None si está vacía)"""
+    with gallery_cache.acquire() as gallery:
+        if len(gallery) == 0:
+            return None
+
+        with stage_seconds.time(*SEARCH_STAGE):
+            position, best_dist = rerank_shortlist(gallery, encoding, shortlist_ids)
+            stage = "fine_shortlist"
+            if position is None or best_dist >= threshold:
+                indices, distances = gallery.search(encoding, k=1)
+                position, best_dist, stage = int(indices[0]), float(distances[0]), "fine_full"
+
+        return gallery.ids[position], gallery.names[position], best_dist, stage
+
+
+async def match_face_cascade(file: UploadFile, threshold: float) -> MatchResponse:
+    """
+    /match con MATCH_MODE=cascade|coarse. La etapa de 128 dimensiones decide sola los
+    casos claros; en los dudosos Facenet512 compara solo contra la lista corta y,
+    si ahí no hay match, contra toda la galería. Con MATCH_MODE=coarse decide siempre
+    la etapa de 128 dimensiones. Las búsquedas corren en el threadpool.
+    """
+    contents = await file.read()
+    image = await run_in_threadpool(load_image, contents)
+
+    # El control de calidad va antes de cualquiera de los dos modelos; Facenet512 reutiliza la cara detectada
+    face = await detect_gated_face(image) if QUALITY_GATE else None
+
+    start = time.perf_counter()
+    coarse_encoding = await embed_coarse(contents, image)
+    if coarse_encoding is None and MATCH_MODE == "coarse":
+        raise HTTPException(
+            status_code=422,
+            detail={"message": "No se detectó ninguna cara con el detector de 128 dimensiones", "reasons": ["no_face"], "scores": {}}
+        )
+
+    decision, shortlist_ids, shortlist_names, distances = None, [], [], []
+    if coarse_encoding is not None:
+        shortlist_ids, shortlist_names, distances, complete = await run_in_threadpool(search_coarse, coarse_encoding)
+
+        decision = coarse_decision(distances, COARSE_THRESHOLD, COARSE_MARGIN)
+        # Sin 128 dimensiones para toda la galería, un rechazo podría dejar afuera a alguien
+        if decision == "reject" and not complete:
+            decision = None
+    if decision is None and MATCH_MODE == "coarse":
+        decision = "match" if len(distances) and distances[0] < COARSE_THRESHOLD else "reject"
+    cascade_stats.record_stage("coarse", time.perf_counter() - start)
+
+    if decision is not None:
+        cascade_stats.record_outcome(f"coarse_{decision}")
+        best_id = shortlist_ids[0] if shortlist_ids else None
+        best_name = shortlist_names[0] if shortlist_names else None
+        best_dist = float(distances[0]) if shortlist_ids else None
+        # La distancia es de 128 dimensiones: se reporta contra su propio umbral
+        return await build_match_response(best_id, best_name, best_dist, COARSE_THRESHOLD, decision == "match", "coarse")
+
+    start = time.perf_counter()
+    encoding = await embed_contents(contents, image, face)
+
+    result = await run_in_threadpool(search_fine, encoding, shortlist_ids, threshold)
+    if result is None:
+        return MatchResponse(match_found=False, threshold=threshold, message="La base de datos está vacía")
+    best_id, best_name, best_dist, stage = result
+
+    cascade_stats.record_stage("fine", time.perf_counter() - start)
+    cascade_stats.record_outcome(stage)
+    return await build_match_response(best_id, best_name, best_dist, threshold, best_dist < threshold, stage)
+
+
+async def build_match_response(best_id, best_name, best_dist, threshold: float, match_found: bool, stage: str | None = None) -> MatchResponse:
+    """MatchResponse de un solo candidato; los datos de perfil se traen solo si hubo match"""
+    if match_found:
+        match_details = await run_in_threadpool(fetch_person_details, best_id)
+        return MatchResponse(
+            match_found=True,
+            person_name=best_name,
+            distance=best_dist,
+            threshold=threshold,
+            linkedin_content=match_details.get('linkedin_content'),
+            message=f"Match encontrado: {best_name}",
+            stage=stage
+        )
+
+    return MatchResponse(
+        match_found=False,
+        person_name=best_name,
+        distance=best_dist,
+        threshold=threshold,
+        message=f"No se encontró match. El más cercano fue {best_name} con distancia {best_dist:.4f}" if best_name else "No se encontraron coincidencias",
+        stage=stage
+    )
+
+
+async def match_all_faces(file: UploadFile, threshold: float) -> MatchResponse:
+    """
+    Identifica todas las caras de una imagen: una detección, un solo forward pass
+    con todas las caras y una sola búsqueda matricial contra la galería.
+    """
+    if not DEEPFACE_AVAILABLE:
+        raise HTTPException(
+            status_code=500,
+            detail="DeepFace no está instalado. Es requerido para calcular embeddings de 512 dimensiones."
+        )
+
+    contents = await file.read()
+
+    try:
+        image = await run_in_threadpool(load_image, contents)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error al decodificar la imagen: {str(e)}")
+
+    try:
+        with stage_seconds.time(*DETECT_STAGE):
+            detections = await inference_pool.run(detect_faces, image, quality_thresholds if QUALITY_GATE else None)
+        if not detections:
+            return MatchResponse(match_found=False, threshold=threshold, message="No se detectaron caras en la imagen", faces=[])
+
+        # Las caras que no pasan el control de calidad no entran al batch; se reportan con sus motivos
+        for detection in detections:
+            if "quality" in detection:
+                record_quality(detection["quality"])
+        usable = [detection["face"] for detection in detections if passed_gate(detection)]
+
+        encodings = np.empty((0, 0), dtype=np.float32)
+        if usable:
+            with stage_seconds.time(*EMBED_STAGE):
+                encodings = await inference_pool.run(embed_batch, np.stack(usable))
+    except InferenceQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error al procesar la imagen con DeepFace: {str(e)}")
+
+    return await build_faces_response(detections, encodings, threshold)
+
+
+async def build_faces_response(detections: list, encodings: np.ndarray, threshold: float) -> MatchResponse:
+    """
+    Identifica los embeddings contra la galería y arma la respuesta con una entrada por cara.
+    `encodings` corresponde, en orden, a las detecciones que pasaron el control de calidad;
+    las demás se reportan sin identificar y con sus motivos.
+    """
+    results = await run_in_threadpool(identify_embeddings, encodings, threshold) if len(encodings) else []
+
+    matched_ids = [result["person_id"] for result in results if result["match_found"]]
+    details = await run_in_threadpool(fetch_people_details, matched_ids) if matched_ids else {}
+
+    faces = []
+    pending_results = iter(results)
+    for detection in detections:
+        if not passed_gate(detection):
+            faces.append(FaceMatch(
+                box=list(detection["box"]) if detection.get("box") else None,
+                confidence=detection.get("confidence"),
+                match_found=False,
+                reasons=detection["quality"]["reasons"]
+            ))
+            continue
+
+        result = next(pending_results)
+        person = details.get(result["person_id"], {}) if result["match_found"] else {}
+        faces.append(FaceMatch(
+            box=list(detection["box"]) if detection.get("box") else None,
+            confidence=detection.get("confidence"),
+            match_found=result["match_found"],
+            id=result["person_id"] if result["match_found"] else None,
+            person_name=result["person_name"],
+            distance=result["distance"],
+            linkedin_content=person.get("linkedin_content"),
+            discord_username=person.get("discord_username"),
+            photo_path=person.get("photo_path")
+        ))
+
+    # Campos de primer nivel: la cara con menor distancia (compatibles con el modo de una cara)
+    best = min((face for face in faces if face.distance is not None), key=lambda face: face.distance, default=None)
+    identified = sum(face.match_found for face in faces)
+    skipped = sum(face.reasons is not None for face in faces)
+    message = f"{len(faces)} caras procesadas, {identified} identificadas"
+    if skipped:
+        message += f", {skipped} descartadas por calidad"
+
+    return MatchResponse(
+        match_found=identified > 0,
+        person_name=best.person_name if best else None,
+        distance=best.distance if best else None,
+        threshold=threshold,
+        linkedin_content=best.linkedin_content if best else None,
+        message=message,
+        faces=faces
+    )
+
+
+async def process_stream_frame(tracker: FaceTracker, contents: bytes, threshold: float) -> list:
+    """
+    Procesa un frame del stream: detecta caras, las asocia a los tracks y solo
+    calcula embeddings de tracks nuevos o con mejor calidad. Retorna los mensajes
+    a enviar: cambios de identidad, tracks perdidos y las cajas del frame.
+    """
+    image = await run_in_threadpool(load_image, contents)
+    with stage_seconds.time(*DETECT_STAGE):
+        detections = await inference_pool.run(detect_faces, image, quality_thresholds if QUALITY_GATE else None)
+    to_embed, lost = tracker.update(detections)
+
+    if QUALITY_GATE:
+        # Las caras que no pasan el control no se embeben: el track se identifica con un frame mejor
+        for _, detection, _ in to_embed:
+            record_quality(detection["quality"])
+        to_embed = [entry for entry in to_embed if entry[1]["quality"]["passed"]]
+
+    messages = []
+
+    if to_embed:
+        # Todas las caras del frame entran juntas al micro-batcher: un solo forward pass
+        with stage_seconds.time(*EMBED_STAGE):
+            embeddings = await asyncio.gather(*(embedding_batcher.submit(detection["face"]) for _, detection, _ in to_embed))
+        results = await run_in_threadpool(identify_embeddings, np.stack(embeddings), threshold)
+
+        changed = []
+        for (track, _, quality), embedding, result in zip(to_embed, embeddings, results):
+            # La vara de calidad del track sube solo con una detección que se llegó a embeber
+            track.quality = quality
+            track.embedding = embedding
+            previous = track.identity
+            track.identity = result
+            if previous is None or (previous["person_id"], previous["match_found"]) != (result["person_id"], result["match_found"]):
+                changed.append(track)
+
+        matched_ids = [track.identity["person_id"] for track in changed if track.identity["match_found"]]
+        details = await run_in_threadpool(fetch_people_details, matched_ids) if matched_ids else {}
+
+        for track in changed:
+            identity = track.identity
+            person = details.get(identity["person_id"], {}) if identity["match_found"] else {}
+            messages.append({
+                "type": "identity",
+                "track_id": track.track_id,
+                "box": track.box,
+                "match_found": identity["match_found"],
+                "person_name": identity["person_name"],
+                "distance": identity["distance"],
+                "threshold": threshold,
+                "linkedin_content": person.get("linkedin_content"),
+                "discord_username": person.get("discord_username"),
+                "photo_path": person.get("photo_path")
+            })
+
+    for track in lost:
+        messages.append({"type": "lost", "track_id": track.track_id})
+
+    messages.append({
+        "type": "tracks",
+        "tracks": [
+            {
+                "track_id": track.track_id,
+                "box": track.box,
+                "person_name": track.identity["person_name"] if track.identity and track.identity["match_found"] else None
+            }
+            for track in tracker.tracks.values()
+            if track.missed == 0
+        ]
+    })
+
+    return messages
+
+
+def require_admin(x_admin_token: str | None):
+    """Valida el token de administración enviado en el header X-Admin-Token"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Endpoints de administración deshabilitados (ADMIN_TOKEN no configurado)")
+    if x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=401, detail="Token de administración inválido")
+
+
 @app.get("/")
 def root():
     """Endpoint raíz"""
@@ -133,113 +1085,172 @@ def root():
         "model": "DeepFace Facenet512 (512 dimensiones)",
         "endpoints": {
             "/match": "POST - Recibe imagen como archivo y retorna match usando DeepFace",
-            "/health": "GET - Estado del servidor"
+            "/match/topk": "POST - Retorna los k más cercanos con verificación contra el segundo mejor",
+            "/match/crops": "POST - Identifica caras ya recortadas (y opcionalmente alineadas) sin correr el detector",
+            "/match/samples": "POST - Identifica a una persona con varios frames: un batch, promedio sin outliers y una búsqueda",
+            "/search/topk": "POST - Igual que /match/topk pero recibe un embedding ya calculado (JSON)",
+            "/health": "GET - Liveness: el proceso responde (no consulta la base)",
+            "/cache/stats": "GET - Hits, misses y tamaño de las cachés",
+            "/ready": "GET - 200 cuando los modelos y la galería están cargados, 503 mientras tanto; incluye el último chequeo de Supabase",
+            "/ws/recognize": "WebSocket - Reconocimiento continuo de frames de cámara con seguimiento de caras",
+            "/decode/stats": "GET - Tiempo promedio y máximo de decodificación de imágenes",
+            "/gallery/status": "GET - Generación actual de la galería, tiempo de construcción y cantidad de filas",
+            "/metrics": "GET - Métricas en formato Prometheus (latencia por etapa, galería, cachés, cola de inferencia)",
+            "/quality/stats": "GET - Tasa de caras descartadas por el control de calidad y costo de cada etapa",
+            "/cascade/stats": "GET - Etapa que decidió cada /match con MATCH_MODE=cascade|coarse",
+            "/admin/gallery/refresh": "POST - Sincroniza la galería en memoria; ?full=true la recarga completa, ?wait=false en segundo plano (requiere X-Admin-Token)",
+            "/admin/gallery/evaluate": "POST - Mide recall y latencia del índice contra la búsqueda exacta (requiere X-Admin-Token)",
+            "/admin/gallery/storage-report": "POST - Compara memoria, latencia y recall de float32/float16/pq (requiere X-Admin-Token)",
+            "/admin/profile/cpu": "POST - Perfil de CPU por muestreo durante ?seconds=N, en formato collapsed (requiere X-Admin-Token)",
+            "/admin/profile/memory": "GET - Top de asignaciones de tracemalloc y crecimiento desde el snapshot anterior (requiere X-Admin-Token)"
         }
     }
 
 
 @app.get("/health")
-def health():
-    """Endpoint de salud"""
-    try:
-        # Verificar conexión con Supabase
-        response = supabase.table("known_people").select("id").limit(1).execute()
-        return {
-            "status": "healthy",
-            "supabase_connected": True,
-            "database_records": len(response.data) if response.data else 0
-        }
-    except Exception as e:
-        return {
-            "status": "unhealthy",
-            "supabase_connected": False,
-            "error": str(e)
-        }
+async def health():
+    """
+    Liveness: solo confirma que el proceso atiende requests. No consulta la base ni
+    pasa por el threadpool, así responde igual aunque los workers estén ocupados.
+    """
+    return {"status": "alive", "uptime_seconds": time.time() - STARTED_AT}
+
+
+@app.get("/ready")
+async def ready():
+    """
+    Readiness: no recibe tráfico hasta que los modelos estén precalentados y la galería
+    cargada. Supabase se reporta con el último resultado del chequeo en segundo plano.
+    """
+    body = {
+        "ready": is_ready(),
+        "models_loaded": startup_state["models_loaded"],
+        "gallery_loaded": gallery_cache.loaded,
+        "gallery_size": len(gallery_cache.gallery),
+        "warmup_seconds": startup_state["warmup_seconds"],
+        "warmup_error": startup_state["warmup_error"],
+        "supabase": {**supabase_check.status(), "required": READY_REQUIRES_SUPABASE}
+    }
+    if coarse_gallery_cache is not None:
+        body["coarse_gallery_loaded"] = coarse_gallery_cache.loaded
+    return JSONResponse(status_code=200 if body["ready"] else 503, content=body)
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Contadores de las cachés en memoria"""
+    return {
+        "embeddings": embedding_cache.stats(),
+        "profiles": profile_cache.stats()
+    }
+
+
+@app.get("/decode/stats")
+def decode_statistics():
+    """Tiempo de decodificación de imágenes subidas y cuántas se redujeron"""
+    return {
+        "max_image_side": MAX_IMAGE_SIDE,
+        **decode_stats.stats()
+    }
+
+
+@app.get("/gallery/status")
+def gallery_status():
+    """Generación publicada de la galería (filas, tiempo de construcción) y refresh en curso"""
+    return gallery_cache.status()
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Métricas en formato de texto de Prometheus: latencia por etapa y por endpoint, galería, cachés y cola"""
+    return Response(content=metrics_registry.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/quality/stats")
+def quality_statistics():
+    """Caras descartadas por el control de calidad (por motivo) y costo promedio de cada etapa"""
+    return {
+        "enabled": QUALITY_GATE,
+        "thresholds": dataclasses.asdict(quality_thresholds),
+        **quality_stats.stats()
+    }
+
+
+@app.get("/cascade/stats")
+def cascade_statistics():
+    """Cuántas veces decidió cada etapa del matcher en cascada y su latencia promedio"""
+    return {
+        "mode": MATCH_MODE,
+        "coarse_threshold": COARSE_THRESHOLD,
+        "coarse_margin": COARSE_MARGIN,
+        "shortlist": CASCADE_SHORTLIST,
+        **cascade_stats.stats()
+    }
 
 
 @app.post("/match", response_model=MatchResponse)
-async def match_face(file: UploadFile = File(...), threshold: float = Form(1.0)):
+async def match_face(file: UploadFile = File(...), threshold: float = Form(1.0), multi_face: bool = Form(False)):
     """
-    Recibe una imagen como archivo y busca el mejor match en Supabase.
+    Recibe una imagen como archivo y busca el mejor match en la galería en memoria.
     Usa DeepFace Facenet512 (512 dimensiones) para calcular embeddings.
     
     Args:
         file: Archivo de imagen
         threshold: Umbral de coincidencia (default 1.0 para embeddings de 512 dims)
                    Valores típicos: 0.6-1.2 para Facenet512
+        multi_face: Identificar todas las caras de la imagen (retorna `faces`)
     
     Returns:
         MatchResponse con información del match encontrado
     """
+    if multi_face:
+        return await match_all_faces(file, threshold)
+
+    if MATCH_MODE != "fine":
+        try:
+            return await match_face_cascade(file, threshold)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
+
     try:
-        # 1. Leer imagen del archivo
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents))
+        # 1-2. Leer imagen y calcular encoding facial (con caché por contenido)
+        target_encoding = await embed_upload(file)
         
-        # Convertir a RGB si es necesario
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # 2. Calcular encoding facial
-        target_encoding = calculate_face_encoding(image)
-        
-        # 3. Obtener encodings de Supabase (usar face_encoding que tiene 512 dimensiones)
+        # 3. Comparar contra la generación actual de la galería en memoria (sin consultar Supabase)
+        def find_nearest():
+            with gallery_cache.acquire() as gallery:
+                if len(gallery) == 0:
+                    return None
+
+                # 4. Buscar el vecino más cercano (distancias a toda la galería en una sola operación matricial)
+                with stage_seconds.time(*SEARCH_STAGE):
+                    indices, distances = gallery.search(target_encoding, k=1)
+                return gallery.ids[int(indices[0])], gallery.names[int(indices[0])], float(distances[0])
+
+        # En el threadpool, como rank_candidates: recorrer una galería grande no debe frenar el event loop
         try:
-            response = supabase.table("known_people").select(
-                "full_name, face_encoding, face_encoding_deepface_512, linkedin_content, discord_username"
-            ).execute()
-            people_db = response.data
-            
-            if not people_db:
-                return MatchResponse(
-                    match_found=False,
-                    threshold=threshold,
-                    message="La base de datos está vacía"
-                )
-        except Exception as e:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Error al conectar con Supabase: {str(e)}"
+            nearest = await run_in_threadpool(find_nearest)
+        except ValueError as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+        if nearest is None:
+            return MatchResponse(
+                match_found=False,
+                threshold=threshold,
+                message="La base de datos está vacía"
             )
-        
-        # 4. Comparar con todos los registros
-        best_match = None
-        best_dist = float("inf")
-        match_details = None
-        
-        for person in people_db:
-            try:
-                # Priorizar face_encoding_deepface_512 si existe, sino usar face_encoding
-                # Ambos deberían tener 512 dimensiones (DeepFace Facenet512)
-                db_encoding_array = person.get('face_encoding_deepface_512') or person.get('face_encoding')
-                
-                if not db_encoding_array:
-                    continue  # Saltar si no tiene embedding
-                
-                # Convertir lista JSON a numpy array
-                db_encoding = np.array(db_encoding_array)
-                
-                # Validar que las dimensiones coincidan
-                if len(db_encoding) != len(target_encoding):
-                    print(f"⚠️  Advertencia: Dimensiones no coinciden. DB: {len(db_encoding)}, Target: {len(target_encoding)}")
-                    continue
-                
-                # Calcular distancia Euclidiana
-                dist = np.linalg.norm(target_encoding - db_encoding)
-                
-                if dist < best_dist:
-                    best_dist = dist
-                    best_match = person['full_name']
-                    match_details = person
-            except Exception as e:
-                # Continuar con el siguiente registro si hay error
-                print(f"⚠️  Error procesando registro: {e}")
-                continue
-        
+
+        best_id, best_match, best_dist = nearest
+
         # 5. Determinar si hay match
         match_found = best_dist < threshold
         
         if match_found:
+            # Solo se consulta la DB para traer los datos de la persona encontrada
+            match_details = await run_in_threadpool(fetch_person_details, best_id)
+
             return MatchResponse(
                 match_found=True,
                 person_name=best_match,
@@ -263,6 +1274,261 @@ async def match_face(file: UploadFile = File(...), threshold: float = Form(1.0))
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
 
+@app.post("/match/crops", response_model=MatchResponse)
+async def match_face_crops(
+    files: list[UploadFile] = File(...),
+    threshold: float = Form(1.0),
+    aligned: bool = Form(False)
+):
+    """
+    Identifica caras ya recortadas por el cliente (por ejemplo con face-api.js en
+    el navegador), sin correr el detector sobre el frame completo.
+
+    Args:
+        files: Uno o más recortes de cara (una cara por archivo)
+        threshold: Umbral de coincidencia (default 1.0 para Facenet512)
+        aligned: Los recortes ya vienen alineados; solo se redimensionan y corre el modelo
+    """
+    if not DEEPFACE_AVAILABLE:
+        raise HTTPException(
+            status_code=500,
+            detail="DeepFace no está instalado. Es requerido para calcular embeddings de 512 dimensiones."
+        )
+
+    if len(files) > MAX_CROPS_PER_REQUEST:
+        raise HTTPException(status_code=400, detail=f"Máximo {MAX_CROPS_PER_REQUEST} recortes por request")
+
+    contents = [await file.read() for file in files]
+
+    try:
+        images = await run_in_threadpool(lambda: [load_image(data) for data in contents])
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error al decodificar los recortes: {str(e)}")
+
+    try:
+        with stage_seconds.time(*DETECT_STAGE):
+            faces = await inference_pool.run(prepare_crops, images, aligned)
+        with stage_seconds.time(*EMBED_STAGE):
+            encodings = await inference_pool.run(embed_batch, faces)
+    except InferenceQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error al procesar los recortes con DeepFace: {str(e)}")
+
+    return await build_faces_response([{} for _ in images], encodings, threshold)
+
+
+@app.post("/match/topk", response_model=TopKResponse)
+async def match_face_topk(
+    file: UploadFile = File(...),
+    threshold: float = Form(1.0),
+    k: int = Form(3, ge=1, le=MAX_TOPK),
+    second_best_ratio: float = Form(0.75),
+    exact: bool = Form(False)
+):
+    """
+    Recibe una imagen y retorna los k vecinos más cercanos de la galería,
+    con el veredicto de ambigüedad (mejor vs segundo mejor) calculado en el servidor.
+
+    Args:
+        file: Archivo de imagen
+        threshold: Umbral de coincidencia (default 1.0 para Facenet512)
+        k: Cantidad de candidatos a retornar
+        second_best_ratio: El mejor debe ser menor que este factor por el segundo (default 0.75)
+        exact: Forzar búsqueda exacta (ground truth) aunque haya un índice aproximado
+    """
+    try:
+        target_encoding = await embed_upload(file)
+
+        return await run_in_threadpool(rank_candidates, target_encoding, k, threshold, second_best_ratio, exact)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
+
+
+@app.post("/match/samples", response_model=MultiSampleResponse)
+async def match_face_samples(
+    files: list[UploadFile] = File(...),
+    threshold: float = Form(1.0),
+    k: int = Form(3, ge=1, le=MAX_TOPK),
+    second_best_ratio: float = Form(0.75)
+):
+    """
+    Identifica a una persona a partir de varios frames (por ejemplo, las muestras
+    que captura el frontend) en un solo request: un batch de inferencia con las
+    muestras útiles, el promedio de sus embeddings normalizados y una sola búsqueda.
+
+    Args:
+        files: Frames de la misma persona (máximo MAX_SAMPLES_PER_REQUEST)
+        threshold: Umbral de coincidencia (default 1.0 para Facenet512)
+        k: Cantidad de candidatos a retornar
+        second_best_ratio: El mejor debe ser menor que este factor por el segundo (default 0.75)
+    """
+    if not DEEPFACE_AVAILABLE:
+        raise HTTPException(
+            status_code=500,
+            detail="DeepFace no está instalado. Es requerido para calcular embeddings de 512 dimensiones."
+        )
+
+    if len(files) > MAX_SAMPLES_PER_REQUEST:
+        raise HTTPException(status_code=400, detail=f"Máximo {MAX_SAMPLES_PER_REQUEST} muestras por request")
+
+    contents = [await file.read() for file in files]
+
+    try:
+        images = await run_in_threadpool(lambda: [load_image(data) for data in contents])
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error al decodificar las muestras: {str(e)}")
+
+    try:
+        with stage_seconds.time(*DETECT_STAGE):
+            detections = await inference_pool.run(detect_primary_faces, images, quality_thresholds if QUALITY_GATE else None)
+        for detection in detections:
+            if detection is not None and "quality" in detection:
+                record_quality(detection["quality"])
+
+        kept, discarded = select_samples(detections, SAMPLE_MIN_QUALITY_RATIO)
+        if not kept:
+            failed = [item for item in discarded if item["reason"] != "no_face"]
+            if not failed:
+                raise HTTPException(status_code=400, detail="No se detectó ninguna cara en las muestras")
+
+            # Hubo caras pero ninguna pasó el control de calidad: el mismo 422 que /match, con el detalle por muestra
+            assessments = {item["index"]: detections[item["index"]]["quality"] for item in failed}
+            samples = [
+                {**item, "reasons": assessments[item["index"]]["reasons"], "scores": assessments[item["index"]]["scores"]}
+                if item["index"] in assessments else item
+                for item in discarded
+            ]
+            reasons = list(dict.fromkeys(reason for assessment in assessments.values() for reason in assessment["reasons"]))
+            raise low_quality_error({"reasons": reasons, "scores": {}}, samples=samples)
+
+        with stage_seconds.time(*EMBED_STAGE):
+            encodings = await inference_pool.run(embed_batch, np.stack([detections[index]["face"] for index in kept]))
+    except HTTPException:
+        raise
+    except InferenceQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error al procesar las muestras con DeepFace: {str(e)}")
+
+    target_encoding, used = aggregate_embeddings(encodings, SAMPLE_OUTLIER_DISTANCE)
+    discarded += [{"index": index, "reason": "outlier"} for index, keep in zip(kept, used) if not keep]
+
+    result = await run_in_threadpool(rank_candidates, target_encoding, k, threshold, second_best_ratio)
+
+    return MultiSampleResponse(
+        **result.model_dump(),
+        samples_received=len(files),
+        samples_used=int(used.sum()),
+        discarded=sorted(discarded, key=lambda item: item["index"])
+    )
+
+
+@app.post("/search/topk", response_model=TopKResponse)
+async def search_embedding_topk(request: EmbeddingSearchRequest):
+    """
+    Busca los k vecinos más cercanos de un embedding ya calculado (por ejemplo,
+    el promedio de varias muestras) sin que el cliente tenga que descargar la tabla.
+    """
+    if len(request.embedding) != gallery_cache.dimensions:
+        raise HTTPException(
+            status_code=422,
+            detail=f"El embedding tiene {len(request.embedding)} dimensiones (esperado: {gallery_cache.dimensions})"
+        )
+
+    target_encoding = np.asarray(request.embedding, dtype=np.float32)
+    return await run_in_threadpool(
+        rank_candidates, target_encoding, request.k, request.threshold, request.second_best_ratio, request.exact
+    )
+
+
+@app.websocket("/ws/recognize")
+async def recognize_stream(websocket: WebSocket):
+    """
+    Reconocimiento continuo sobre frames de cámara por una sola conexión.
+
+    Cliente -> servidor: cada frame como mensaje binario (JPEG/PNG). Un mensaje de
+    texto JSON `{"threshold": 1.0}` cambia el umbral de la sesión.
+
+    Servidor -> cliente (JSON):
+    - `identity`: la identidad de un track cambió (cara nueva o persona distinta)
+    - `lost`: un track dejó de verse
+    - `tracks`: cajas de las caras visibles en el frame procesado
+    - `busy` / `error`: el frame no se pudo procesar
+
+    Si llegan frames más rápido de lo que se procesan, se procesa el más reciente
+    y los intermedios se descartan.
+    """
+    await websocket.accept()
+
+    if not DEEPFACE_AVAILABLE:
+        await websocket.send_json({"type": "error", "detail": "DeepFace no está instalado"})
+        await websocket.close()
+        return
+
+    tracker = FaceTracker(
+        iou_threshold=TRACK_IOU_THRESHOLD,
+        max_missed=TRACK_MAX_MISSED_FRAMES,
+        quality_margin=TRACK_QUALITY_MARGIN
+    )
+    session = {"threshold": 1.0, "frame": None, "received": 0, "dropped": 0}
+    frame_ready = asyncio.Event()
+
+    async def receive_frames():
+        while True:
+            try:
+                message = await websocket.receive()
+            except (WebSocketDisconnect, RuntimeError):
+                return
+            if message["type"] == "websocket.disconnect":
+                return
+
+            if message.get("bytes") is not None:
+                session["received"] += 1
+                if session["frame"] is not None:
+                    session["dropped"] += 1
+                session["frame"] = message["bytes"]
+                frame_ready.set()
+            elif message.get("text"):
+                try:
+                    session["threshold"] = float(json.loads(message["text"]).get("threshold", session["threshold"]))
+                except (ValueError, TypeError, AttributeError):
+                    await websocket.send_json({"type": "error", "detail": "Mensaje de texto inválido"})
+
+    receiver = asyncio.create_task(receive_frames())
+
+    try:
+        while True:
+            waiter = asyncio.create_task(frame_ready.wait())
+            done, _ = await asyncio.wait({receiver, waiter}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver in done:
+                waiter.cancel()
+                break
+
+            frame_ready.clear()
+            contents, session["frame"] = session["frame"], None
+            frame = session["received"]
+
+            try:
+                messages = await process_stream_frame(tracker, contents, session["threshold"])
+            except InferenceQueueFull as e:
+                messages = [{"type": "busy", "detail": str(e)}]
+            except ValueError as e:
+                messages = [{"type": "error", "detail": str(e)}]
+            except Exception as e:
+                messages = [{"type": "error", "detail": f"Error al procesar el frame: {str(e)}"}]
+
+            for message in messages:
+                await websocket.send_json({**message, "frame": frame, "dropped_frames": session["dropped"]})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+
+
 @app.post("/calculate-embedding")
 async def calculate_embedding_only(file: UploadFile = File(...)):
     """
@@ -276,16 +1542,8 @@ async def calculate_embedding_only(file: UploadFile = File(...)):
         JSON con el embedding calculado (array de 512 números)
     """
     try:
-        # 1. Leer imagen del archivo
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents))
-        
-        # Convertir a RGB si es necesario
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # 2. Calcular encoding facial
-        target_encoding = calculate_face_encoding(image)
+        # 1-2. Leer imagen y calcular encoding facial (con caché por contenido)
+        target_encoding = await embed_upload(file)
         
         return {
             "embedding": target_encoding.tolist(),
@@ -299,6 +1557,152 @@ async def calculate_embedding_only(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f"Error al calcular embedding: {str(e)}")
 
 
+@app.post("/admin/gallery/refresh")
+async def refresh_gallery(full: bool = False, wait: bool = True, x_admin_token: str | None = Header(None)):
+    """
+    Sincroniza la galería con Supabase bajo demanda (`full=true` fuerza la recarga completa).
+    Con `wait=false` construye la próxima generación en segundo plano y responde 202.
+    """
+    require_admin(x_admin_token)
+
+    if not wait:
+        started = gallery_cache.refresh_in_background(full)
+        return JSONResponse(
+            status_code=202,
+            content={
+                "status": "building" if started else "already_building",
+                "generation": gallery_cache.status()["generation"]
+            }
+        )
+
+    try:
+        gallery = await run_in_threadpool(gallery_cache.refresh, full)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al recargar la galería: {str(e)}")
+
+    return {
+        "status": "ok",
+        "people": len(gallery),
+        "dimensions": gallery.dimensions,
+        "source": gallery.source,
+        "loaded_at": gallery.loaded_at,
+        "generation": gallery_cache.status()["generation"],
+        "sync": gallery_cache.last_sync
+    }
+
+
+@app.post("/admin/gallery/evaluate")
+async def evaluate_gallery_index(k: int = 10, samples: int = 100, noise: float = 0.1, x_admin_token: str | None = Header(None)):
+    """
+    Compara el índice de la galería contra la búsqueda exacta usando como consultas
+    embeddings de la propia galería con ruido gaussiano. Retorna recall@k y latencias.
+    """
+    require_admin(x_admin_token)
+
+    gallery = gallery_cache.gallery
+    if len(gallery) == 0:
+        raise HTTPException(status_code=409, detail="La galería está vacía")
+
+    def run():
+        rng = np.random.default_rng()
+        picks = rng.choice(len(gallery), size=min(samples, len(gallery)), replace=False)
+        queries = gallery.embeddings[picks] + rng.normal(scale=noise, size=(len(picks), gallery.dimensions)).astype(np.float32)
+        return evaluate_recall(gallery.engine, gallery.embeddings, queries, k=min(k, len(gallery)))
+
+    result = await run_in_threadpool(run)
+    result["index"] = type(gallery.engine).__name__
+    result["people"] = len(gallery)
+    result["bytes_per_person"] = (gallery.engine.nbytes + getattr(gallery.engine, "rerank_nbytes", 0)) / len(gallery)
+    return result
+
+
+@app.post("/admin/gallery/storage-report")
+async def gallery_storage_report(k: int = 10, samples: int = 50, noise: float = 0.1, x_admin_token: str | None = Header(None)):
+    """
+    Construye la galería actual en cada modo de almacenamiento (float32, float16, pq)
+    y reporta memoria por persona, latencia de búsqueda y recall@k contra float32.
+    """
+    require_admin(x_admin_token)
+
+    gallery = gallery_cache.gallery
+    if len(gallery) == 0:
+        raise HTTPException(status_code=409, detail="La galería está vacía")
+
+    def run():
+        rng = np.random.default_rng()
+        picks = rng.choice(len(gallery), size=min(samples, len(gallery)), replace=False)
+        queries = gallery.embeddings[picks] + rng.normal(scale=noise, size=(len(picks), gallery.dimensions)).astype(np.float32)
+        return compare_storage_modes(
+            gallery.embeddings, queries, k=min(k, len(gallery)), pq_m=PQ_SUBSPACES, rerank=RERANK_CANDIDATES
+        )
+
+    return {
+        "people": len(gallery),
+        "current_storage": GALLERY_STORAGE,
+        "source": gallery.source,
+        "modes": await run_in_threadpool(run)
+    }
+
+
+@app.post("/admin/profile/cpu")
+async def profile_cpu(
+    seconds: float = 10, interval_ms: float = 5, include_idle: bool = False, x_admin_token: str | None = Header(None)
+):
+    """
+    Muestrea las pilas de todos los hilos del worker durante `seconds` mientras sigue
+    atendiendo tráfico. Retorna las pilas en formato collapsed (flamegraph.pl, speedscope).
+    Sin `include_idle` se omiten los hilos bloqueados esperando (locks, colas, selector).
+    """
+    require_admin(x_admin_token)
+
+    if not 0 < seconds <= PROFILER_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds debe estar entre 0 y {PROFILER_MAX_SECONDS:g}")
+    if interval_ms < 1:
+        raise HTTPException(status_code=400, detail="interval_ms debe ser al menos 1")
+
+    try:
+        result = await run_in_threadpool(cpu_profiler.profile, seconds, interval_ms / 1000, include_idle)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    return Response(
+        content=collapsed(result["stacks"]),
+        media_type="text/plain",
+        headers={"X-Profile-Samples": str(result["samples"]), "X-Profile-Seconds": f"{result['seconds']:.3f}"}
+    )
+
+
+@app.post("/admin/profile/memory/start")
+def start_memory_tracing(frames: int = 1, x_admin_token: str | None = Header(None)):
+    """Activa tracemalloc (agrega costo a cada asignación de memoria hasta que se detenga)"""
+    require_admin(x_admin_token)
+    memory_tracker.start(max(1, frames))
+    return {"tracing": True, "frames": max(1, frames)}
+
+
+@app.post("/admin/profile/memory/stop")
+def stop_memory_tracing(x_admin_token: str | None = Header(None)):
+    require_admin(x_admin_token)
+    memory_tracker.stop()
+    return {"tracing": False}
+
+
+@app.get("/admin/profile/memory")
+def memory_snapshot(top: int = 25, group_by: str = "lineno", x_admin_token: str | None = Header(None)):
+    """
+    Las ubicaciones que más memoria retienen según tracemalloc y cuánto crecieron
+    desde el snapshot anterior (galería, cachés, buffers de imágenes...).
+    """
+    require_admin(x_admin_token)
+
+    if group_by not in ("lineno", "filename", "traceback"):
+        raise HTTPException(status_code=400, detail="group_by debe ser lineno, filename o traceback")
+    if not memory_tracker.tracing:
+        raise HTTPException(status_code=409, detail="tracemalloc no está activo: POST /admin/profile/memory/start")
+
+    return memory_tracker.snapshot(top, group_by)
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,113 @@
+"""
+Micro-batching dinámico para la inferencia de Facenet512.
+
+Las caras que llegan dentro de una ventana corta (`max_wait_ms`) se agrupan en
+un batch de hasta `max_batch_size` y se procesan en un solo forward pass. Cada
+request recibe su propio embedding a través de un future. En CPU, un forward
+con N caras es mucho más barato que N forwards de una cara.
+"""
+import asyncio
+
+import numpy as np
+
+from inference_pool import InferencePool
+
+
+class MicroBatcher:
+    """
+    Agrupa caras de requests concurrentes y las ejecuta en batch en el pool.
+
+    Args:
+        run_batch: Función (n, ...) -> (n, d) que calcula los embeddings del batch
+        pool: Pool de inferencia donde se ejecuta `run_batch`
+        max_batch_size: Cantidad máxima de caras por batch
+        max_wait_ms: Tiempo máximo que la primera cara espera a que se llene el batch
+    """
+
+    def __init__(self, run_batch, pool: InferencePool, max_batch_size: int = 8, max_wait_ms: float = 5.0):
+        self.run_batch = run_batch
+        self.pool = pool
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+
+        self.batches_run = 0
+        self.items_run = 0
+
+        self._queue = None
+        self._collector = None
+        self._running = set()
+
+    def start(self):
+        """Inicia la tarea que arma los batches (llamar desde el event loop)"""
+        if self._collector is None:
+            self._queue = asyncio.Queue()
+            self._collector = asyncio.create_task(self._collect())
+
+    async def stop(self):
+        if self._collector is not None:
+            self._collector.cancel()
+            try:
+                await self._collector
+            except asyncio.CancelledError:
+                pass
+            self._collector = None
+
+    @property
+    def pending(self) -> int:
+        """Caras esperando a ser agrupadas en un batch"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    @property
+    def average_batch_size(self) -> float:
+        return self.items_run / self.batches_run if self.batches_run else 0.0
+
+    async def submit(self, item: np.ndarray) -> np.ndarray:
+        """Encola una cara y espera su embedding"""
+        if self._collector is None:
+            raise RuntimeError("MicroBatcher no iniciado")
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Se lanza sin esperar para que el siguiente batch se arme mientras este corre
+            task = asyncio.create_task(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: list):
+        # Requests cancelados (cliente desconectado) no ocupan lugar en el batch
+        batch = [(item, future) for item, future in batch if not future.done()]
+        if not batch:
+            return
+
+        try:
+            embeddings = await self.pool.run(self.run_batch, np.stack([item for item, _ in batch]))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches_run += 1
+        self.items_run += len(batch)
+
+        for (_, future), embedding in zip(batch, embeddings):
+            if not future.done():
+                future.set_result(embedding)
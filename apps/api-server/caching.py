@@ -0,0 +1,93 @@
+"""
+Caché LRU en memoria con expiración por tiempo (TTL) y contadores de hit/miss.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Caché LRU acotada por cantidad de entradas y por antigüedad.
+
+    Args:
+        max_entries: Cantidad máxima de entradas (0 desactiva la caché)
+        ttl_seconds: Segundos que una entrada es válida (0 = sin expiración)
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 600.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Retorna el valor guardado o None (cuenta un hit o un miss)"""
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None and self.ttl_seconds and entry[0] < time.monotonic():
+                del self._entries[key]
+                self.evictions += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        if self.max_entries <= 0:
+            return
+
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else float("inf")
+
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hit_ratio
+        }
+
+
+def content_key(contents: bytes, *parts: str) -> str:
+    """Clave de caché a partir del hash de los bytes y de los parámetros que afectan el resultado"""
+    digest = hashlib.blake2b(contents, digest_size=16).hexdigest()
+    return ":".join((*parts, digest))
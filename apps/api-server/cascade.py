@@ -0,0 +1,83 @@
+"""
+Matcher en cascada: primero los embeddings baratos de 128 dimensiones y
+Facenet512 solo cuando el resultado es dudoso.
+
+- La etapa de 128 dimensiones decide sola si el mejor candidato está claramente
+  por debajo del umbral (y sin un segundo cercano) o claramente por encima.
+- Si no, Facenet512 re-ordena solo la lista corta de candidatos de la primera etapa.
+
+Modos: "fine" (solo Facenet512), "cascade" y "coarse" (solo 128 dimensiones).
+"""
+import threading
+import weakref
+
+CASCADE_MODES = ("fine", "cascade", "coarse")
+
+
+def coarse_decision(distances, threshold: float = 0.6, margin: float = 0.08, second_best_ratio: float = 0.75) -> str | None:
+    """
+    Veredicto de la etapa de 128 dimensiones a partir de las distancias ordenadas:
+    "match", "reject" o None si hay que consultar a Facenet512.
+    """
+    if len(distances) == 0:
+        return None
+
+    best = float(distances[0])
+    second = float(distances[1]) if len(distances) > 1 else None
+    unambiguous = second is None or best < second_best_ratio * second
+
+    if best < threshold - margin and unambiguous:
+        return "match"
+    if best > threshold + margin:
+        return "reject"
+    return None
+
+
+def coarse_covers(coarse_gallery, gallery) -> bool:
+    """
+    True si toda persona vigente de `gallery` (Facenet512) tiene vector en
+    `coarse_gallery`: solo entonces la primera etapa puede rechazar sin dejar a
+    nadie afuera. Se calcula una vez por par de generaciones.
+    """
+    cached = gallery.__dict__.get("_coarse_coverage")
+    if cached is not None and cached[0]() is coarse_gallery:
+        return cached[1]
+
+    covered = all(coarse_gallery.position_of(gallery.ids[int(i)]) is not None for i in gallery.live_positions())
+    # Referencia débil: la generación Facenet512 no debe mantener viva una generación vieja de 128 dimensiones
+    object.__setattr__(gallery, "_coarse_coverage", (weakref.ref(coarse_gallery), covered))
+    return covered
+
+
+class CascadeStats:
+    """Cuántas veces decidió cada etapa y cuánto tardó cada una"""
+
+    OUTCOMES = ("coarse_match", "coarse_reject", "fine_shortlist", "fine_full")
+
+    def __init__(self):
+        self.counts = dict.fromkeys(self.OUTCOMES, 0)
+        self.seconds = {"coarse": 0.0, "fine": 0.0}
+        self.runs = {"coarse": 0, "fine": 0}
+        self._lock = threading.Lock()
+
+    def record_stage(self, stage: str, seconds: float):
+        with self._lock:
+            self.runs[stage] += 1
+            self.seconds[stage] += seconds
+
+    def record_outcome(self, outcome: str):
+        with self._lock:
+            self.counts[outcome] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = sum(self.counts.values())
+            return {
+                "requests": total,
+                "decided_by": dict(self.counts),
+                "coarse_decided_ratio": (self.counts["coarse_match"] + self.counts["coarse_reject"]) / total if total else 0.0,
+                "average_ms": {
+                    stage: 1000 * self.seconds[stage] / self.runs[stage] if self.runs[stage] else 0.0
+                    for stage in self.seconds
+                }
+            }
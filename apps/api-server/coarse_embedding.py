@@ -0,0 +1,34 @@
+"""
+Embeddings de 128 dimensiones con face_recognition (dlib), la primera etapa del
+matcher en cascada. Son los mismos que guarda `face_encoding_faceapi`
+(`add_faceapi_embeddings.py`) y cuestan bastante menos CPU que Facenet512.
+"""
+import numpy as np
+from PIL import Image
+
+try:
+    import face_recognition
+    FACE_RECOGNITION_AVAILABLE = True
+except ImportError:
+    FACE_RECOGNITION_AVAILABLE = False
+
+COARSE_COLUMN = "face_encoding_faceapi"
+COARSE_DIMENSIONS = 128
+
+
+def compute_coarse_embedding(image: Image.Image) -> np.ndarray:
+    """
+    Embedding de 128 dimensiones de la primera cara (detector HOG, igual que
+    `face_recognition.face_encodings` en los scripts de carga).
+    Lanza ValueError si no se detecta ninguna cara.
+    """
+    if not FACE_RECOGNITION_AVAILABLE:
+        raise RuntimeError("face_recognition no está instalado. Es requerido para la etapa de 128 dimensiones.")
+
+    pixels = np.asarray(image.convert("RGB"))
+    locations = face_recognition.face_locations(pixels)
+    if not locations:
+        raise ValueError("No se detectó ninguna cara en la imagen")
+
+    encodings = face_recognition.face_encodings(pixels, known_face_locations=locations[:1])
+    return np.asarray(encodings[0], dtype=np.float32)
@@ -0,0 +1,206 @@
+"""
+Cálculo de embeddings faciales con DeepFace Facenet512 (512 dimensiones).
+
+Este módulo no depende de FastAPI ni de Supabase para poder ejecutarse dentro de
+los workers del pool de inferencia (hilos o procesos). Los errores se reportan
+con excepciones estándar y el servidor las traduce a respuestas HTTP.
+
+El cálculo se divide en dos etapas para poder agrupar requests en batches:
+1. `detect_face`: detecta y alinea la cara, y la deja lista para el modelo.
+2. `embed_batch`: corre Facenet512 sobre varias caras en un solo forward pass.
+
+`detect_face_checked` agrega entre ambas el control de calidad (`quality_gate.py`):
+las caras movidas, chicas, mal iluminadas o de perfil no llegan al modelo.
+"""
+import time
+
+import numpy as np
+from PIL import Image
+
+from quality_gate import LowQualityFace, QualityThresholds, assess_face
+
+# DeepFace para embeddings de 512 dimensiones (Facenet512)
+try:
+    from deepface import DeepFace
+    DEEPFACE_AVAILABLE = True
+except ImportError:
+    DEEPFACE_AVAILABLE = False
+
+MODEL_NAME = "Facenet512"  # Modelo de 512 dimensiones
+DETECTOR_BACKEND = "opencv"  # Backend de detección
+MODEL_INPUT_SIZE = (160, 160)  # Entrada de Facenet512 (alto, ancho)
+
+
+def _require_deepface():
+    if not DEEPFACE_AVAILABLE:
+        raise RuntimeError("DeepFace no está instalado. Es requerido para calcular embeddings de 512 dimensiones.")
+
+
+def resize_face(face: np.ndarray, target_size: tuple = MODEL_INPUT_SIZE) -> np.ndarray:
+    """
+    Redimensiona una cara (float en [0, 1]) al tamaño de entrada del modelo
+    manteniendo la proporción y rellenando con negro, igual que DeepFace.represent.
+    """
+    import cv2
+
+    target_h, target_w = target_size
+    factor = min(target_h / face.shape[0], target_w / face.shape[1])
+    new_size = (max(1, int(face.shape[1] * factor)), max(1, int(face.shape[0] * factor)))
+    face = cv2.resize(face.astype(np.float32), new_size)
+
+    diff_h = target_h - face.shape[0]
+    diff_w = target_w - face.shape[1]
+    face = np.pad(
+        face,
+        ((diff_h // 2, diff_h - diff_h // 2), (diff_w // 2, diff_w - diff_w // 2), (0, 0)),
+        "constant"
+    )
+
+    if face.max() > 1:
+        face = face / 255.0
+
+    return face.astype(np.float32)
+
+
+def _extract_faces(image: Image.Image) -> list:
+    _require_deepface()
+
+    # DeepFace acepta el array de píxeles directamente (en BGR): sin re-encodear a JPEG ni pasar por disco
+    pixels = np.ascontiguousarray(np.asarray(image)[:, :, ::-1])
+
+    return DeepFace.extract_faces(
+        img_path=pixels,
+        detector_backend=DETECTOR_BACKEND,
+        enforce_detection=False,  # No fallar si no detecta cara claramente
+        align=True
+    )
+
+
+def _prepare_face(face: dict) -> np.ndarray:
+    # extract_faces entrega la cara en RGB y el modelo espera BGR
+    return resize_face(face["face"][:, :, ::-1])
+
+
+def detect_face(image: Image.Image) -> np.ndarray:
+    """
+    Detecta la primera cara de una imagen RGB y la retorna preprocesada para el
+    modelo: array float32 (160, 160, 3) en orden BGR, como lo espera Facenet512.
+    Lanza ValueError si no se detecta ninguna cara.
+    """
+    faces = _extract_faces(image)
+
+    if not faces:
+        raise ValueError("No se detectó ninguna cara en la imagen")
+
+    return _prepare_face(faces[0])
+
+
+def detect_face_checked(image: Image.Image, thresholds: QualityThresholds) -> tuple[np.ndarray, dict]:
+    """
+    Como `detect_face`, pero evalúa la calidad de la cara antes de prepararla.
+    Retorna (cara, evaluación con el tiempo de detección en `detect_seconds`).
+    Lanza LowQualityFace si no hay cara o si no pasa el control.
+    """
+    start = time.perf_counter()
+    faces = _extract_faces(image)
+    detect_seconds = time.perf_counter() - start
+
+    assessment = assess_face(faces[0], thresholds) if faces else {"passed": False, "reasons": ["no_face"], "scores": {}, "seconds": 0.0}
+    assessment["detect_seconds"] = detect_seconds
+    if not assessment["passed"]:
+        raise LowQualityFace(assessment)
+
+    return _prepare_face(faces[0]), assessment
+
+
+def detect_faces(image: Image.Image, thresholds: QualityThresholds | None = None) -> list:
+    """
+    Detecta todas las caras de una imagen RGB. Cada una es un dict con `face`
+    (preprocesada como en `detect_face`), `box` (x, y, ancho, alto) y `confidence`.
+    Con `thresholds` se agrega `quality`, la evaluación de `assess_face`.
+    Retorna una lista vacía si no hay caras.
+    """
+    detections = []
+
+    for face in _extract_faces(image):
+        confidence = float(face.get("confidence") or 0.0)
+
+        # Sin detecciones, extract_faces retorna la imagen completa con confianza 0
+        if confidence <= 0:
+            continue
+
+        area = face["facial_area"]
+        detection = {
+            "face": _prepare_face(face),
+            "box": (int(area["x"]), int(area["y"]), int(area["w"]), int(area["h"])),
+            "confidence": confidence
+        }
+        if thresholds is not None:
+            detection["quality"] = assess_face(face, thresholds)
+        detections.append(detection)
+
+    return detections
+
+
+def prepare_crop(image: Image.Image, aligned: bool = True) -> np.ndarray:
+    """
+    Prepara para el modelo una cara que el cliente ya recortó. Con `aligned=True`
+    solo se redimensiona, sin detector. Si no, el detector corre sobre el recorte
+    (mucho más chico que el frame completo) para alinearla; si no encuentra la
+    cara se usa el recorte tal cual.
+    """
+    if not aligned:
+        faces = [face for face in _extract_faces(image) if face.get("confidence")]
+        if faces:
+            return _prepare_face(faces[0])
+
+    # Mismo formato que _prepare_face: BGR, normalizado a [0, 1] por resize_face
+    return resize_face(np.asarray(image)[:, :, ::-1])
+
+
+def prepare_crops(images: list, aligned: bool = True) -> np.ndarray:
+    """Prepara varios recortes en una sola tarea del pool: array (n, 160, 160, 3)"""
+    return np.stack([prepare_crop(image, aligned) for image in images])
+
+
+def embed_batch(faces: np.ndarray) -> np.ndarray:
+    """Calcula los embeddings de un batch de caras (n, 160, 160, 3) en un solo forward pass"""
+    _require_deepface()
+
+    # build_model guarda el modelo en caché: solo se construye la primera vez en cada worker
+    client = DeepFace.build_model(MODEL_NAME)
+    batch = np.asarray(faces, dtype=np.float32)
+
+    keras_model = getattr(client, "model", None)
+    if keras_model is None:
+        # Versiones de DeepFace sin acceso al modelo Keras: un forward por cara
+        return np.array([client.forward(face[np.newaxis, ...]) for face in batch], dtype=np.float32)
+
+    return np.asarray(keras_model(batch, training=False), dtype=np.float32)
+
+
+def compute_embedding(image: Image.Image) -> np.ndarray:
+    """
+    Calcula el embedding facial de una imagen RGB (primera cara detectada).
+    Lanza ValueError si no se detecta ninguna cara.
+    """
+    face = detect_face(image)
+    return embed_batch(face[np.newaxis, ...])[0]
+
+
+def warm_up() -> float:
+    """
+    Construye el modelo y el detector y corre una inferencia de prueba, para que
+    el primer request real no pague la carga de pesos. Retorna los segundos que tomó.
+    """
+    _require_deepface()
+    start = time.perf_counter()
+
+    # Detector: imagen gris sin caras (enforce_detection=False no falla)
+    dummy_image = Image.new("RGB", (320, 240), (128, 128, 128))
+    face = detect_face(dummy_image)
+
+    # Modelo: un forward pass completo
+    embed_batch(face[np.newaxis, ...])
+
+    return time.perf_counter() - start
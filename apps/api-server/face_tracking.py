@@ -0,0 +1,120 @@
+"""
+Seguimiento de caras entre frames consecutivos de una cámara.
+
+Cada cara detectada se asocia al track del frame anterior con el que más se
+superpone (IoU). Así el embedding solo se recalcula cuando aparece una cara
+nueva o cuando la cara del track se ve bastante mejor que la que se usó para
+identificarla (más grande, más centrada en el detector).
+"""
+from dataclasses import dataclass, field
+
+
+def iou(a: tuple, b: tuple) -> float:
+    """Intersección sobre unión de dos cajas (x, y, ancho, alto)"""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+
+    inter_w = min(ax + aw, bx + bw) - max(ax, bx)
+    inter_h = min(ay + ah, by + bh) - max(ay, by)
+    if inter_w <= 0 or inter_h <= 0:
+        return 0.0
+
+    intersection = inter_w * inter_h
+    return intersection / (aw * ah + bw * bh - intersection)
+
+
+def face_quality(detection: dict) -> float:
+    """Calidad de una detección: área de la cara ponderada por la confianza del detector"""
+    _, _, width, height = detection["box"]
+    return width * height * detection["confidence"]
+
+
+@dataclass
+class Track:
+    """Una cara seguida entre frames"""
+    track_id: int
+    box: tuple
+    quality: float = 0.0  # Calidad de la detección con la que se calculó el embedding actual
+    missed: int = 0  # Frames consecutivos sin detección asociada
+    embedding: object = field(default=None, repr=False)
+    identity: dict | None = None  # Último resultado de identificación enviado al cliente
+
+
+class FaceTracker:
+    """
+    Asocia detecciones a tracks por IoU (greedy, de mayor a menor superposición).
+
+    Args:
+        iou_threshold: Superposición mínima para considerar que es la misma cara
+        max_missed: Frames sin detección antes de dar el track por perdido
+        quality_margin: Factor de mejora de calidad que justifica recalcular el embedding
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, max_missed: int = 5, quality_margin: float = 1.25):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.quality_margin = quality_margin
+
+        self.tracks = {}  # track_id -> Track
+        self._next_id = 1
+
+    def update(self, detections: list) -> tuple[list, list]:
+        """
+        Procesa las detecciones de un frame. Retorna (a_embeber, perdidos):
+        - a_embeber: (track, detección, calidad) cuyo embedding hay que (re)calcular.
+          `track.quality` no cambia acá: quien embebe la detección la asigna después,
+          así una detección descartada (p. ej. por el control de calidad) no sube la vara.
+        - perdidos: tracks que dejaron de verse y se descartaron
+        """
+        pairs = sorted(
+            (
+                (iou(track.box, detection["box"]), track_id, index)
+                for track_id, track in self.tracks.items()
+                for index, detection in enumerate(detections)
+            ),
+            reverse=True
+        )
+
+        matched_tracks = set()
+        matched_detections = set()
+        to_embed = []
+
+        for overlap, track_id, index in pairs:
+            if overlap < self.iou_threshold:
+                break
+            if track_id in matched_tracks or index in matched_detections:
+                continue
+
+            matched_tracks.add(track_id)
+            matched_detections.add(index)
+
+            track = self.tracks[track_id]
+            detection = detections[index]
+            track.box = detection["box"]
+            track.missed = 0
+
+            quality = face_quality(detection)
+            if track.embedding is None or quality > track.quality * self.quality_margin:
+                to_embed.append((track, detection, quality))
+
+        for index, detection in enumerate(detections):
+            if index in matched_detections:
+                continue
+
+            track = Track(track_id=self._next_id, box=detection["box"])
+            self._next_id += 1
+            self.tracks[track.track_id] = track
+            matched_tracks.add(track.track_id)
+            to_embed.append((track, detection, face_quality(detection)))
+
+        lost = []
+        for track_id in list(self.tracks):
+            if track_id in matched_tracks:
+                continue
+
+            track = self.tracks[track_id]
+            track.missed += 1
+            if track.missed > self.max_missed:
+                lost.append(self.tracks.pop(track_id))
+
+        return to_embed, lost
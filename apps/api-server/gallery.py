@@ -0,0 +1,680 @@
+"""
+Galería en memoria con los embeddings de la tabla `known_people`.
+
+El servidor carga la galería una sola vez al iniciar y la refresca en segundo
+plano cada `refresh_interval` segundos (o bajo demanda). Así `/match` no necesita
+descargar la tabla completa en cada request: solo compara contra la matriz en
+memoria y consulta la DB para traer los datos de la persona encontrada.
+
+Los refreshes son incrementales: solo se descargan las filas nuevas (por
+`created_at`), las que recibieron `face_encoding_deepface_512` después de
+insertarse y, si cambió la cantidad de filas, la lista de ids para detectar
+borrados. Los cambios se aplican sobre el índice actual sin reconstruirlo.
+"""
+import threading
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from index_holder import VersionedIndex
+from search_engine import SearchEngine
+
+# Columnas con embeddings de 512 dimensiones (DeepFace Facenet512), en orden de prioridad
+EMBEDDING_COLUMNS = ("face_encoding_deepface_512", "face_encoding")
+
+# Columna que marca las filas nuevas en el refresh incremental
+WATERMARK_COLUMN = "created_at"
+
+# Solo se traen ids, nombres y vectores; linkedin_content se consulta aparte para el match
+GALLERY_SELECT = f"id, full_name, {WATERMARK_COLUMN}, " + ", ".join(EMBEDDING_COLUMNS)
+
+# Supabase limita la cantidad de filas por request, así que se pagina
+PAGE_SIZE = 1000
+
+# Ids por request en los filtros `in` (la lista viaja en la URL)
+ID_CHUNK_SIZE = 200
+
+# Filas dadas de baja (borradas o reemplazadas) toleradas antes de forzar una recarga completa
+MAX_REMOVED_RATIO = 0.05
+MIN_REMOVED_FOR_RELOAD = 1000
+
+
+def gallery_select(watermark_column: str = WATERMARK_COLUMN, embedding_columns: tuple = EMBEDDING_COLUMNS) -> str:
+    """Columnas a descargar: id, nombre, watermark y las columnas de embedding"""
+    if watermark_column == WATERMARK_COLUMN and embedding_columns == EMBEDDING_COLUMNS:
+        return GALLERY_SELECT
+    columns = dict.fromkeys(("id", "full_name", WATERMARK_COLUMN, watermark_column, *embedding_columns))
+    return ", ".join(columns)
+
+
+def encoding_column(row: dict, embedding_columns: tuple = EMBEDDING_COLUMNS) -> str | None:
+    """Primera columna de embedding con valor en la fila, según la prioridad"""
+    return next((column for column in embedding_columns if row.get(column)), None)
+
+
+def row_encoding(row: dict, dimensions: int = 512, embedding_columns: tuple = EMBEDDING_COLUMNS):
+    """Embedding de la fila según la prioridad de columnas (None si no tiene uno válido)"""
+    column = encoding_column(row, embedding_columns)
+    if column is None:
+        return None
+
+    encoding = row[column]
+
+    if len(encoding) != dimensions:
+        print(f"⚠️  Advertencia: {row.get('full_name')} tiene {len(encoding)} dimensiones (esperado: {dimensions})")
+        return None
+
+    return encoding
+
+
+@dataclass(frozen=True)
+class Gallery:
+    """
+    Snapshot inmutable de la galería: una fila de `embeddings` por posición.
+    Las posiciones en `removed` (arreglo ordenado de personas borradas o reemplazadas
+    por una versión más nueva) siguen en la matriz pero se excluyen de las búsquedas.
+    `embedding_columns` son las columnas de las que salió al menos un vector.
+    """
+    ids: list
+    names: list
+    embeddings: np.ndarray
+    loaded_at: float = field(default_factory=time.time)
+    engine: object = field(default=None, repr=False)
+    source: str = "supabase"
+    removed: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.int64))
+    embedding_columns: tuple = ()
+
+    def __post_init__(self):
+        # El índice de búsqueda se construye una vez por snapshot (exacto si no se indica otro)
+        if self.engine is None:
+            object.__setattr__(self, "engine", SearchEngine(self.embeddings))
+
+    @property
+    def exact_engine(self) -> SearchEngine:
+        """Búsqueda exacta sobre la galería (ground truth cuando `engine` es aproximado)"""
+        if isinstance(self.engine, SearchEngine):
+            return self.engine
+
+        exact = self.__dict__.get("_exact_engine")
+        if exact is None:
+            exact = SearchEngine(self.embeddings)
+            object.__setattr__(self, "_exact_engine", exact)
+        return exact
+
+    def __len__(self):
+        return len(self.ids) - len(self.removed)
+
+    @property
+    def dimensions(self) -> int:
+        return self.embeddings.shape[1]
+
+    def position_of(self, person_id) -> int | None:
+        """Posición vigente de una persona (el mapa id -> posición se arma una vez por galería)"""
+        positions = self.__dict__.get("_positions")
+        if positions is None:
+            positions = {self.ids[i]: int(i) for i in self.live_positions()}
+            object.__setattr__(self, "_positions", positions)
+        return positions.get(person_id)
+
+    def live_positions(self) -> np.ndarray:
+        """Posiciones vigentes (sin las dadas de baja)"""
+        positions = np.arange(len(self.ids))
+        if not len(self.removed):
+            return positions
+        return positions[~np.isin(positions, self.removed, assume_unique=True)]
+
+    def search(self, query, k: int = 1, exact: bool = False) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Retorna (posiciones, distancias) de las k personas más cercanas.
+        El índice exacto descarta las bajas antes del argpartition; a los aproximados
+        se les piden `len(removed)` candidatos extra para descartarlas después.
+        """
+        engine = self.exact_engine if exact else self.engine
+        if not len(self.removed):
+            return engine.search(query, k)
+        if isinstance(engine, SearchEngine):
+            return engine.search(query, k, exclude=self.removed)
+
+        indices, distances = engine.search(query, k + len(self.removed))
+        return self._drop_removed(indices, distances, k)
+
+    def search_batch(self, queries, k: int = 1, exact: bool = False) -> list:
+        """
+        Busca varias consultas a la vez. Con el índice exacto es un solo GEMM contra
+        toda la galería; los índices aproximados buscan consulta por consulta.
+        Retorna una lista de (posiciones, distancias), una por consulta.
+        """
+        engine = self.exact_engine if exact else self.engine
+        if isinstance(engine, SearchEngine):
+            indices, distances = engine.search_batch(queries, k, exclude=self.removed)
+            return list(zip(indices, distances))
+
+        wanted = k + len(self.removed)
+        if hasattr(engine, "search_batch"):
+            indices, distances = engine.search_batch(queries, wanted)
+            results = list(zip(indices, distances))
+        else:
+            results = [engine.search(query, wanted) for query in queries]
+
+        return [self._drop_removed(indices, distances, k) for indices, distances in results]
+
+    def _drop_removed(self, indices: np.ndarray, distances: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        if not len(self.removed):
+            return indices[:k], distances[:k]
+        keep = ~np.isin(indices, self.removed, assume_unique=True)
+        return indices[keep][:k], distances[keep][:k]
+
+
+class GrowableMatrix:
+    """
+    Matriz append-only con capacidad de reserva para los refreshes incrementales.
+
+    Las filas nuevas se escriben después del final (o en un buffer nuevo si no hay
+    espacio), nunca sobre filas existentes: las vistas entregadas antes siguen
+    válidas y las galerías anteriores se pueden leer mientras se agrega.
+    """
+
+    def __init__(self, rows: np.ndarray):
+        self._buffer = rows
+        self._size = len(rows)
+
+    def view(self) -> np.ndarray:
+        return self._buffer[:self._size]
+
+    def append(self, rows: np.ndarray) -> np.ndarray:
+        """Agrega filas y retorna la vista con todas las filas"""
+        rows = np.asarray(rows, dtype=np.float32).reshape(-1, self._buffer.shape[1])
+        end = self._size + len(rows)
+
+        # Un memmap de solo lectura (snapshot) también se copia a un buffer propio
+        if end > len(self._buffer) or not self._buffer.flags.writeable:
+            buffer = np.empty((max(end, 2 * self._size, 1024), self._buffer.shape[1]), dtype=np.float32)
+            buffer[:self._size] = self._buffer[:self._size]
+            self._buffer = buffer
+
+        self._buffer[self._size:end] = rows
+        self._size = end
+        return self.view()
+
+
+def build_gallery(rows: list, dimensions: int = 512, index_factory=None, embedding_columns: tuple = EMBEDDING_COLUMNS) -> Gallery:
+    """
+    Construye la galería a partir de filas de `known_people`.
+    Omite filas sin embedding o con dimensiones distintas a `dimensions`.
+    `index_factory(embeddings)` construye el índice de búsqueda (default: exacto).
+    """
+    ids = []
+    names = []
+    vectors = []
+    used_columns = set()
+
+    for row in rows:
+        encoding = row_encoding(row, dimensions, embedding_columns)
+        if encoding is None:
+            continue
+
+        ids.append(row["id"])
+        names.append(row["full_name"])
+        vectors.append(encoding)
+        used_columns.add(encoding_column(row, embedding_columns))
+
+    # Matriz contigua float32 (n, dimensions)
+    embeddings = np.ascontiguousarray(np.array(vectors, dtype=np.float32).reshape(-1, dimensions))
+
+    engine = index_factory(embeddings) if index_factory is not None else None
+
+    return Gallery(
+        ids=ids,
+        names=names,
+        embeddings=embeddings,
+        engine=engine,
+        embedding_columns=tuple(column for column in embedding_columns if column in used_columns)
+    )
+
+
+def _fetch_pages(build_query) -> list:
+    """Descarga todas las páginas de la consulta `build_query()` (que debe estar ordenada)"""
+    rows = []
+    start = 0
+
+    while True:
+        response = build_query().range(start, start + PAGE_SIZE - 1).execute()
+        page = response.data or []
+        rows.extend(page)
+
+        if len(page) < PAGE_SIZE:
+            return rows
+
+        start += PAGE_SIZE
+
+
+def fetch_gallery_rows(supabase, table: str = "known_people", select: str = GALLERY_SELECT) -> list:
+    """Descarga ids, nombres y embeddings de todas las filas, paginando por id"""
+    return _fetch_pages(lambda: supabase.table(table).select(select).order("id"))
+
+
+def fetch_rows_since(supabase, column: str, watermark, table: str = "known_people", select: str = GALLERY_SELECT) -> list:
+    """Filas con `column` posterior al watermark (todas si el watermark es None)"""
+    def build_query():
+        query = supabase.table(table).select(select)
+        if watermark is not None:
+            query = query.gt(column, watermark)
+        return query.order(column).order("id")
+
+    return _fetch_pages(build_query)
+
+
+def fetch_rows_by_id(supabase, ids, table: str = "known_people", select: str = GALLERY_SELECT, require_column: str | None = None) -> list:
+    """
+    Filas con los ids indicados, en tandas de ID_CHUNK_SIZE. Con `require_column`
+    solo retorna las que ya tienen esa columna (p. ej. backfill de embeddings listo).
+    """
+    ids = sorted(ids)
+    rows = []
+
+    for start in range(0, len(ids), ID_CHUNK_SIZE):
+        query = supabase.table(table).select(select).in_("id", ids[start:start + ID_CHUNK_SIZE])
+        if require_column:
+            query = query.not_.is_(require_column, "null")
+        rows.extend(query.execute().data or [])
+
+    return rows
+
+
+def count_rows(supabase, table: str = "known_people", not_null: str | None = None) -> int:
+    """Cantidad de filas de la tabla (sin descargarlas); con `not_null`, solo las que tienen esa columna"""
+    query = supabase.table(table).select("id", count="exact")
+    if not_null:
+        query = query.not_.is_(not_null, "null")
+    response = query.limit(1).execute()
+    return response.count or 0
+
+
+def fetch_all_ids(supabase, table: str = "known_people") -> set:
+    """Ids de todas las filas (solo la columna id, para detectar borrados)"""
+    rows = _fetch_pages(lambda: supabase.table(table).select("id").order("id"))
+    return {row["id"] for row in rows}
+
+
+class GalleryCache:
+    """
+    Mantiene la galería actual y la refresca en un hilo de fondo.
+
+    Cada refresh construye una generación nueva sin tocar la publicada (nunca se
+    modifica en el lugar) y la publica con un swap atómico en un `VersionedIndex`.
+    Los requests usan `with cache.acquire() as gallery:` y no esperan al refresh;
+    la generación anterior se retira cuando terminan sus lectores.
+
+    Con refresh_mode="delta" (default) cada refresh solo aplica los cambios desde
+    la última sincronización; la recarga completa ocurre al inicio, cada
+    `full_refresh_every` refreshes (0 = nunca) y cuando se acumulan muchas bajas.
+    Sin `watermark_column` que registre ediciones (p. ej. `updated_at`), los cambios
+    en filas que ya tenían `face_encoding_deepface_512` llegan con la recarga completa.
+
+    `embedding_columns` permite mantener otra galería con otro tipo de embedding
+    (p. ej. `face_encoding_faceapi` de 128 dimensiones para el matcher en cascada).
+
+    Con `snapshot_path` la galería también puede leerse de un snapshot en disco
+    (mmap compartido entre workers):
+    - source="supabase": consulta la DB y, si `write_snapshot`, actualiza el snapshot.
+    - source="snapshot": solo lee el snapshot, y lo recarga cuando cambia en disco.
+    """
+
+    def __init__(
+        self,
+        supabase,
+        refresh_interval: float = 300.0,
+        dimensions: int = 512,
+        index_factory=None,
+        snapshot_path: str | None = None,
+        source: str = "supabase",
+        write_snapshot: bool = False,
+        model_name: str | None = None,
+        refresh_mode: str = "delta",
+        full_refresh_every: int = 12,
+        watermark_column: str = WATERMARK_COLUMN,
+        on_change=None,
+        embedding_columns: tuple = EMBEDDING_COLUMNS
+    ):
+        if source not in ("supabase", "snapshot"):
+            raise ValueError(f"Fuente de galería inválida: {source} (usar 'supabase' o 'snapshot')")
+        if source == "snapshot" and not snapshot_path:
+            raise ValueError("source='snapshot' requiere snapshot_path")
+        if refresh_mode not in ("delta", "full"):
+            raise ValueError(f"Modo de refresh inválido: {refresh_mode} (usar 'delta' o 'full')")
+
+        self.supabase = supabase
+        self.refresh_interval = refresh_interval
+        self.dimensions = dimensions
+        self.index_factory = index_factory
+        self.snapshot_path = snapshot_path
+        self.source = source
+        self.write_snapshot = write_snapshot
+        self.model_name = model_name
+        self.refresh_mode = refresh_mode
+        self.full_refresh_every = full_refresh_every
+        self.watermark_column = watermark_column
+        self.embedding_columns = tuple(embedding_columns)  # En orden de prioridad; la primera es la preferida
+        # on_change(ids) se llama después de publicar cambios (ids=None: puede haber cambiado cualquier fila)
+        self.on_change = on_change
+        self.last_error = None
+        self.last_sync = None  # Resumen del último refresh (modo, cambios, duración)
+        self.loaded = False  # True después de la primera carga exitosa
+
+        self._snapshot_mtime = None
+
+        # Estado del refresh incremental (solo se modifica con _refresh_lock tomado)
+        self._select = gallery_select(watermark_column, self.embedding_columns)
+        self._synced = False
+        self._watermark = None
+        self._known_ids = set()  # Todos los ids de la tabla, tengan o no embedding
+        self._positions = {}  # id -> posición vigente en la galería
+        self._backfill_ids = set()  # Filas sin la columna de embedding preferida (pendientes de backfill)
+        self._matrix = None
+        self._deltas_since_full = 0
+        self._changed_ids = None
+
+        self._index = VersionedIndex(Gallery(ids=[], names=[], embeddings=np.empty((0, dimensions), dtype=np.float32)))
+        self._refresh_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._background_build = None
+
+    @property
+    def gallery(self) -> Gallery:
+        """Galería de la generación actual (para lecturas cortas; los requests usan `acquire`)"""
+        return self._index.current.gallery
+
+    def acquire(self):
+        """Context manager que mantiene viva la generación actual mientras se usa"""
+        return self._index.acquire()
+
+    @property
+    def building(self) -> bool:
+        """True mientras se construye la próxima generación"""
+        return self._refresh_lock.locked()
+
+    def refresh_in_background(self, full: bool = False) -> bool:
+        """Construye la próxima generación en un hilo aparte. False si ya hay una en curso."""
+        if self.building or (self._background_build is not None and self._background_build.is_alive()):
+            return False
+
+        def run():
+            try:
+                self.refresh(full)
+            except Exception as e:
+                print(f"⚠️  Error al refrescar la galería: {e}")
+
+        self._background_build = threading.Thread(target=run, name="gallery-build", daemon=True)
+        self._background_build.start()
+        return True
+
+    def status(self) -> dict:
+        """Generación publicada, generaciones drenando y estado del último refresh"""
+        gallery = self.gallery
+        return {
+            **self._index.status(),
+            "source": gallery.source,
+            "index": type(gallery.engine).__name__,
+            "removed_positions": len(gallery.removed),
+            "building": self.building,
+            "loaded": self.loaded,
+            "last_sync": self.last_sync,
+            "last_error": self.last_error
+        }
+
+    def refresh(self, full: bool = False) -> Gallery:
+        """
+        Sincroniza la galería con su fuente y la reemplaza. Lanza la excepción si falla.
+        Aplica solo los cambios desde el último refresh salvo que `full` o el modo lo exijan.
+        """
+        if self.source == "snapshot":
+            return self.load_snapshot()
+
+        with self._refresh_lock:
+            try:
+                start = time.perf_counter()
+                previous = self.gallery
+
+                if full or self._needs_full_reload():
+                    gallery, changes = self._full_reload()
+                else:
+                    gallery, changes = self._delta_reload()
+                build_seconds = time.perf_counter() - start
+
+                if gallery is not previous and self.snapshot_path and self.write_snapshot:
+                    from gallery_snapshot import snapshot_mtime, write_snapshot
+
+                    write_snapshot(gallery, self.snapshot_path, self.model_name)
+                    self._snapshot_mtime = snapshot_mtime(self.snapshot_path)
+
+                self._index.publish(gallery, build_seconds)
+                if gallery is not previous:
+                    self._notify_change(self._changed_ids)
+                self.last_sync = {**changes, "seconds": time.perf_counter() - start, "at": time.time()}
+                self.last_error = None
+                self.loaded = True
+            except Exception as e:
+                # El estado incremental puede haber quedado a medias: la próxima vez se recarga todo
+                self._synced = False
+                self.last_error = str(e)
+                raise
+
+        if changes["mode"] == "full":
+            print(f"✅ Galería cargada: {len(gallery)} personas")
+        elif gallery is not previous:
+            print(
+                f"✅ Galería sincronizada: +{changes['added']} ~{changes['updated']} "
+                f"-{changes['removed']} ({len(gallery)} personas)"
+            )
+        return gallery
+
+    def _notify_change(self, person_ids):
+        if self.on_change is None:
+            return
+        try:
+            self.on_change(person_ids)
+        except Exception as e:
+            print(f"⚠️  Error en on_change de la galería: {e}")
+
+    def _needs_full_reload(self) -> bool:
+        gallery = self.gallery
+        too_many_removed = len(gallery.removed) > max(MIN_REMOVED_FOR_RELOAD, MAX_REMOVED_RATIO * len(gallery.ids))
+
+        return (
+            not self._synced
+            or self.refresh_mode == "full"
+            or too_many_removed
+            or (self.full_refresh_every > 0 and self._deltas_since_full >= self.full_refresh_every)
+        )
+
+    def _full_reload(self) -> tuple[Gallery, dict]:
+        rows = fetch_gallery_rows(self.supabase, select=self._select)
+        gallery = build_gallery(rows, self.dimensions, self.index_factory, self.embedding_columns)
+
+        column = self.watermark_column
+        self._watermark = max((row[column] for row in rows if row.get(column)), default=None)
+        self._known_ids = {row["id"] for row in rows}
+        self._positions = {person_id: position for position, person_id in enumerate(gallery.ids)}
+        self._backfill_ids = {row["id"] for row in rows if not row.get(self.embedding_columns[0])}
+        self._matrix = GrowableMatrix(gallery.embeddings)
+        self._deltas_since_full = 0
+        self._changed_ids = None
+        self._synced = True
+
+        return gallery, {"mode": "full", "added": len(gallery), "updated": 0, "removed": 0}
+
+    def _delta_reload(self) -> tuple[Gallery, dict]:
+        """Descarga solo lo que cambió desde el último refresh y lo aplica a la galería actual"""
+        # 1. Filas nuevas (o editadas, si la columna de watermark registra ediciones)
+        changed = fetch_rows_since(self.supabase, self.watermark_column, self._watermark, select=self._select)
+
+        rows_by_id = {row["id"]: row for row in changed}
+
+        # 2. Borrados (y filas que el watermark no vio): solo si no cuadra la cantidad de filas
+        deleted_ids = set()
+        known_ids = self._known_ids | rows_by_id.keys()
+        if count_rows(self.supabase) != len(known_ids):
+            table_ids = fetch_all_ids(self.supabase)
+            deleted_ids = known_ids - table_ids
+            missing_ids = table_ids - known_ids
+            if missing_ids:
+                for row in fetch_rows_by_id(self.supabase, missing_ids, select=self._select):
+                    rows_by_id[row["id"]] = row
+
+        # 3. Filas que recibieron face_encoding_deepface_512 después de insertarse: solo si no cuadra
+        # la cantidad de filas con esa columna (si no, serían n/ID_CHUNK_SIZE consultas por refresh)
+        pending_ids = self._backfill_ids - deleted_ids
+        if pending_ids and self._backfill_pending(rows_by_id, deleted_ids):
+            for row in fetch_rows_by_id(self.supabase, pending_ids, select=self._select, require_column=self.embedding_columns[0]):
+                rows_by_id.setdefault(row["id"], row)
+
+        self._deltas_since_full += 1
+        self._changed_ids = rows_by_id.keys() | deleted_ids
+        return self._apply_delta(list(rows_by_id.values()), deleted_ids)
+
+    def _backfill_pending(self, rows_by_id: dict, deleted_ids: set) -> bool:
+        """
+        True si la cantidad de filas con la columna preferida en la tabla no coincide con
+        la conocida (contando las filas que acaban de llegar y sin las borradas). Cuesta
+        un `count` en vez de consultar los ids; lo que no detecte lo corrige la recarga completa.
+        """
+        column = self.embedding_columns[0]
+        with_column = (self._known_ids - self._backfill_ids) - rows_by_id.keys() - deleted_ids
+        expected = len(with_column) + sum(1 for row in rows_by_id.values() if row.get(column))
+        return count_rows(self.supabase, not_null=column) != expected
+
+    def _apply_delta(self, rows: list, deleted_ids: set) -> tuple[Gallery, dict]:
+        """
+        Nueva galería = galería actual + filas nuevas al final. Las versiones
+        anteriores de filas editadas y las filas borradas pasan a `removed`.
+        """
+        current = self.gallery
+        removed = set(current.removed.tolist())
+        ids = list(current.ids)
+        names = list(current.names)
+        vectors = []
+        used_columns = set(current.embedding_columns)
+        updated = 0
+
+        for person_id in deleted_ids:
+            self._known_ids.discard(person_id)
+            self._backfill_ids.discard(person_id)
+            position = self._positions.pop(person_id, None)
+            if position is not None:
+                removed.add(position)
+
+        for row in rows:
+            person_id = row["id"]
+            self._known_ids.add(person_id)
+
+            watermark = row.get(self.watermark_column)
+            if watermark and (self._watermark is None or watermark > self._watermark):
+                self._watermark = watermark
+
+            if row.get(self.embedding_columns[0]):
+                self._backfill_ids.discard(person_id)
+            else:
+                self._backfill_ids.add(person_id)
+
+            previous = self._positions.pop(person_id, None)
+            if previous is not None:
+                removed.add(previous)
+
+            encoding = row_encoding(row, self.dimensions, self.embedding_columns)
+            if encoding is None:
+                continue
+
+            updated += previous is not None
+            self._positions[person_id] = len(ids)
+            ids.append(person_id)
+            names.append(row["full_name"])
+            vectors.append(encoding)
+            used_columns.add(encoding_column(row, self.embedding_columns))
+
+        changes = {
+            "mode": "delta",
+            "added": len(vectors) - updated,
+            "updated": updated,
+            "removed": len(removed) - len(current.removed) - updated
+        }
+
+        if not vectors and len(removed) == len(current.removed):
+            return current, changes
+
+        embeddings = current.embeddings
+        engine = current.engine
+        if vectors:
+            # Solo se agregan filas: el índice actual se extiende en vez de reconstruirse
+            embeddings = self._matrix.append(np.array(vectors, dtype=np.float32))
+            engine = current.engine.extended(embeddings, len(current.ids))
+
+        gallery = Gallery(
+            ids=ids,
+            names=names,
+            embeddings=embeddings,
+            engine=engine,
+            source=current.source,
+            removed=np.array(sorted(removed), dtype=np.int64),
+            embedding_columns=tuple(column for column in self.embedding_columns if column in used_columns)
+        )
+        return gallery, changes
+
+    def load_snapshot(self, only_if_changed: bool = False) -> Gallery:
+        """Abre el snapshot en disco (mmap) y reemplaza la galería"""
+        # Import local: gallery_snapshot importa este módulo
+        from gallery_snapshot import load_snapshot, snapshot_mtime
+
+        with self._refresh_lock:
+            mtime = snapshot_mtime(self.snapshot_path)
+            if mtime is None:
+                raise FileNotFoundError(f"No existe el snapshot {self.snapshot_path}")
+
+            if only_if_changed and mtime == self._snapshot_mtime:
+                return self.gallery
+
+            try:
+                start = time.perf_counter()
+                gallery = load_snapshot(self.snapshot_path, self.model_name, self.index_factory, self.embedding_columns)
+                if gallery.dimensions != self.dimensions:
+                    raise ValueError(f"El snapshot tiene {gallery.dimensions} dimensiones (esperado: {self.dimensions})")
+
+                self._index.publish(gallery, time.perf_counter() - start)
+                self._notify_change(None)
+                self._snapshot_mtime = mtime
+                # El snapshot no trae el estado incremental: el próximo refresh desde Supabase es completo
+                self._synced = False
+                self.last_error = None
+                self.loaded = True
+            except Exception as e:
+                self.last_error = str(e)
+                raise
+
+        print(f"✅ Galería cargada desde snapshot: {len(gallery)} personas")
+        return gallery
+
+    def start_background_refresh(self):
+        """Inicia el hilo que refresca la galería periódicamente (si el intervalo > 0)"""
+        if self.refresh_interval <= 0 or self._thread is not None:
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._refresh_loop, name="gallery-refresh", daemon=True)
+        self._thread.start()
+
+    def stop_background_refresh(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _refresh_loop(self):
+        while not self._stop_event.wait(self.refresh_interval):
+            try:
+                if self.source == "snapshot":
+                    self.load_snapshot(only_if_changed=True)
+                else:
+                    self.refresh()
+            except Exception as e:
+                print(f"⚠️  Error al refrescar la galería: {e}")
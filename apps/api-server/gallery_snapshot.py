@@ -0,0 +1,208 @@
+"""
+Snapshot en disco de la galería para compartirla entre workers.
+
+Formato (mismo prefijo, mismo directorio):
+- `<ruta>.json`: sidecar con ids, nombres, modelo, columnas de embedding usadas,
+  dimensiones, fecha, la generación y el nombre de su archivo de vectores.
+- `<ruta>.<generación>.npy`: matriz float32 (n, d) con los embeddings.
+
+Cada escritura crea un archivo de vectores nuevo y recién después reemplaza el
+sidecar (rename atómico), así un lector siempre abre los vectores de la misma
+generación que sus ids. Las generaciones viejas se borran pasados
+`STALE_SECONDS`; los workers que ya las tenían abiertas siguen leyendo el mmap.
+
+Los workers abren el `.npy` con `mmap` en solo lectura: el arranque tarda
+milisegundos y todos los procesos comparten las mismas páginas en memoria.
+
+Uso como script (descarga `known_people` y escribe el snapshot):
+
+    python gallery_snapshot.py [ruta_snapshot]
+"""
+import glob
+import json
+import os
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+from gallery import Gallery
+
+SNAPSHOT_VERSION = 2
+
+# Antigüedad a partir de la cual se borran los archivos de vectores de generaciones anteriores
+STALE_SECONDS = 600
+
+
+def snapshot_prefix(path: str) -> str:
+    """Ruta sin extensión (acepta la ruta base o la del sidecar)"""
+    base, extension = os.path.splitext(path)
+    return base if extension in (".npy", ".json") else path
+
+
+def snapshot_meta_path(path: str) -> str:
+    return snapshot_prefix(path) + ".json"
+
+
+def snapshot_vectors_path(path: str, meta: dict) -> str:
+    """Archivo de vectores de la generación que indica el sidecar"""
+    return os.path.join(os.path.dirname(os.path.abspath(snapshot_meta_path(path))), meta["vectors"])
+
+
+def _write_atomic(path: str, write):
+    """Escribe (en binario) en un temporal único del mismo directorio y lo renombra sobre `path`"""
+    fd, temp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        # mkstemp crea el archivo solo para el dueño; los workers pueden correr con otro usuario
+        os.chmod(temp, 0o644)
+        os.replace(temp, path)
+    except BaseException:
+        os.unlink(temp)
+        raise
+
+
+def _remove_stale_vectors(path: str, current: str):
+    """Borra archivos de vectores de otras generaciones con más de STALE_SECONDS"""
+    prefix = snapshot_prefix(os.path.abspath(path))
+    now = time.time()
+    for candidate in glob.glob(glob.escape(prefix) + ".*.npy"):
+        if os.path.basename(candidate) == current:
+            continue
+        try:
+            if now - os.path.getmtime(candidate) > STALE_SECONDS:
+                os.unlink(candidate)
+        except OSError:
+            # Otro worker ya lo borró (o el sistema no permite borrar un archivo mapeado)
+            pass
+
+
+def write_snapshot(gallery: Gallery, path: str, model_name: str) -> dict:
+    """
+    Escribe una generación nueva del snapshot: primero su archivo de vectores y
+    después el sidecar que lo referencia, ambos con temporales únicos + rename.
+    Varios workers pueden escribir a la vez; gana el último sidecar. Retorna los metadatos.
+    """
+    meta_path = os.path.abspath(snapshot_meta_path(path))
+    os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+
+    # Solo las posiciones vigentes: el snapshot nunca lleva bajas pendientes
+    live = gallery.live_positions()
+    embeddings = gallery.embeddings[live] if len(gallery.removed) else gallery.embeddings
+
+    generation = f"{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}"
+    meta = {
+        "version": SNAPSHOT_VERSION,
+        "generation": generation,
+        "vectors": f"{os.path.basename(snapshot_prefix(meta_path))}.{generation}.npy",
+        "model": model_name,
+        "embedding_columns": list(gallery.embedding_columns),
+        "dimensions": gallery.dimensions,
+        "count": len(gallery),
+        "created_at": time.time(),
+        "ids": [gallery.ids[i] for i in live],
+        "names": [gallery.names[i] for i in live]
+    }
+
+    vectors = np.ascontiguousarray(embeddings, dtype=np.float32)
+    _write_atomic(snapshot_vectors_path(meta_path, meta), lambda f: np.save(f, vectors))
+    _write_atomic(meta_path, lambda f: f.write(json.dumps(meta, ensure_ascii=False).encode("utf-8")))
+    _remove_stale_vectors(meta_path, meta["vectors"])
+
+    return meta
+
+
+def read_snapshot_meta(path: str) -> dict:
+    with open(snapshot_meta_path(path), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def snapshot_mtime(path: str) -> float | None:
+    """Fecha de modificación del sidecar (None si el snapshot no existe)"""
+    try:
+        return os.path.getmtime(snapshot_meta_path(path))
+    except OSError:
+        return None
+
+
+def load_snapshot(
+    path: str,
+    model_name: str | None = None,
+    index_factory=None,
+    embedding_columns: tuple | None = None
+) -> Gallery:
+    """
+    Abre el snapshot con mmap de solo lectura y construye la galería. Lanza
+    ValueError si el snapshot es de otro modelo, usa columnas de embedding fuera
+    de `embedding_columns` o está incompleto.
+    """
+    meta = read_snapshot_meta(path)
+
+    if meta.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"Versión de snapshot no soportada: {meta.get('version')} (regenerar con gallery_snapshot.py)")
+
+    if model_name and meta.get("model") != model_name:
+        raise ValueError(f"El snapshot es del modelo {meta.get('model')}, se esperaba {model_name}")
+
+    columns = tuple(meta.get("embedding_columns", ()))
+    if embedding_columns is not None and not set(columns) <= set(embedding_columns):
+        raise ValueError(
+            f"El snapshot usa las columnas {', '.join(columns)}, se esperaba {', '.join(embedding_columns)}"
+        )
+
+    embeddings = np.load(snapshot_vectors_path(path, meta), mmap_mode="r")
+
+    if embeddings.shape != (meta["count"], meta["dimensions"]) or embeddings.dtype != np.float32:
+        raise ValueError(
+            f"Snapshot inconsistente: vectores {embeddings.shape} {embeddings.dtype}, "
+            f"metadatos ({meta['count']}, {meta['dimensions']})"
+        )
+
+    engine = index_factory(embeddings) if index_factory is not None else None
+
+    return Gallery(
+        ids=meta["ids"],
+        names=meta["names"],
+        embeddings=embeddings,
+        loaded_at=meta["created_at"],
+        engine=engine,
+        source="snapshot",
+        embedding_columns=columns
+    )
+
+
+if __name__ == "__main__":
+    import sys
+
+    from dotenv import load_dotenv
+    from supabase import create_client
+
+    from face_embedding import MODEL_NAME
+    from gallery import build_gallery, fetch_gallery_rows
+
+    # Cargar variables de entorno desde .env
+    load_dotenv()
+
+    SUPABASE_URL = os.getenv("SUPABASE_URL")
+    SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        print("Error: SUPABASE_URL y SUPABASE_KEY deben estar configuradas en el archivo .env")
+        sys.exit(1)
+
+    output = sys.argv[1] if len(sys.argv) > 1 else os.getenv("GALLERY_SNAPSHOT_PATH", "gallery_snapshot")
+
+    print("Descargando embeddings de known_people...")
+    start = time.perf_counter()
+    rows = fetch_gallery_rows(create_client(SUPABASE_URL, SUPABASE_KEY))
+    gallery = build_gallery(rows)
+
+    meta = write_snapshot(gallery, output, MODEL_NAME)
+    vectors_path, meta_path = snapshot_vectors_path(output, meta), snapshot_meta_path(output)
+
+    print(f"✅ Snapshot escrito en {time.perf_counter() - start:.2f}s")
+    print(f"   Personas: {meta['count']} ({meta['dimensions']} dims, modelo {meta['model']}, columnas {', '.join(meta['embedding_columns'])})")
+    print(f"   Vectores: {vectors_path} ({os.path.getsize(vectors_path) / 1024:.1f} KB)")
+    print(f"   Metadatos: {meta_path}")
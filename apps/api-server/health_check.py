@@ -0,0 +1,91 @@
+"""
+Chequeo periódico de dependencias externas (Supabase) en segundo plano.
+
+Las sondas del load balancer no consultan la base: leen el último resultado
+guardado acá, que un hilo actualiza cada `interval` segundos. Así la cantidad de
+consultas no crece con la frecuencia de las sondas ni con la cantidad de workers.
+"""
+import threading
+import time
+
+
+class DependencyCheck:
+    """
+    Corre `check()` cada `interval` segundos y guarda el último resultado.
+    `check` debe lanzar una excepción si la dependencia no responde.
+    """
+
+    def __init__(self, name: str, check, interval: float = 15.0):
+        self.name = name
+        self.check = check
+        self.interval = interval
+
+        self._status = {
+            "ok": None,  # None hasta el primer chequeo
+            "latency_ms": None,
+            "error": None,
+            "last_checked": None,
+            "last_ok": None,
+            "consecutive_failures": 0
+        }
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def ok(self) -> bool | None:
+        return self._status["ok"]
+
+    def run_once(self) -> dict:
+        start = time.perf_counter()
+        try:
+            self.check()
+            ok, error = True, None
+        except Exception as e:
+            ok, error = False, str(e)
+
+        now = time.time()
+        with self._lock:
+            self._status = {
+                "ok": ok,
+                "latency_ms": 1000 * (time.perf_counter() - start),
+                "error": error,
+                "last_checked": now,
+                "last_ok": now if ok else self._status["last_ok"],
+                "consecutive_failures": 0 if ok else self._status["consecutive_failures"] + 1
+            }
+            return dict(self._status)
+
+    def status(self) -> dict:
+        """Último resultado (no consulta la dependencia)"""
+        with self._lock:
+            return dict(self._status)
+
+    def start(self):
+        """Inicia el hilo de chequeo; el primero corre de inmediato"""
+        if self._thread is not None:
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, name=f"{self.name}-check", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _loop(self):
+        previous = None
+        while True:
+            status = self.run_once()
+            # Solo se loguean los cambios de estado, no cada chequeo
+            if not status["ok"] and previous is not False:
+                print(f"⚠️  {self.name} no responde: {status['error']}")
+            elif status["ok"] and previous is False:
+                print(f"✅ {self.name} responde de nuevo")
+            previous = status["ok"]
+
+            if self._stop_event.wait(self.interval):
+                return
@@ -0,0 +1,80 @@
+"""
+Decodificación de imágenes subidas con resolución acotada.
+
+El detector no necesita la resolución completa de una foto de cámara, así que:
+- JPEG: se decodifica directamente a escala reducida (1/2, 1/4 u 1/8) con el
+  modo draft de PIL, sin llegar a materializar la imagen completa.
+- Otros formatos (PNG, WEBP...): se decodifican y se reducen a `max_side`.
+
+En ambos casos el lado mayor del resultado queda en `max_side` o menos.
+"""
+import io
+import threading
+import time
+
+from PIL import Image
+
+
+def decode_image(contents: bytes, max_side: int = 1024) -> tuple[Image.Image, dict]:
+    """
+    Decodifica los bytes de una imagen a RGB con el lado mayor acotado a `max_side`
+    (0 = sin límite). Retorna la imagen y un resumen (tiempo, tamaños, draft).
+    """
+    start = time.perf_counter()
+    image = Image.open(io.BytesIO(contents))
+    image_format = image.format
+    original_size = image.size
+    draft = False
+
+    if max_side and max(original_size) > max_side:
+        if image_format == "JPEG":
+            # draft elige la mayor reducción (hasta 1/8) que deja la imagen >= al tamaño pedido
+            ratio = max_side / max(original_size)
+            requested = (max(1, int(original_size[0] * ratio)), max(1, int(original_size[1] * ratio)))
+            image.draft("RGB", requested)
+            draft = image.size != original_size
+
+    # Convertir a RGB si es necesario (para PNG con transparencia)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+
+    if max_side and max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.Resampling.BILINEAR)
+
+    return image, {
+        "decode_seconds": time.perf_counter() - start,
+        "format": image_format,
+        "original_size": original_size,
+        "decoded_size": image.size,
+        "draft": draft
+    }
+
+
+class DecodeStats:
+    """Contadores acumulados de decodificación (tiempo total, imágenes reducidas)"""
+
+    def __init__(self):
+        self.images = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.downscaled = 0
+        self.draft = 0
+        self._lock = threading.Lock()
+
+    def record(self, info: dict):
+        with self._lock:
+            self.images += 1
+            self.total_seconds += info["decode_seconds"]
+            self.max_seconds = max(self.max_seconds, info["decode_seconds"])
+            self.downscaled += info["decoded_size"] != info["original_size"]
+            self.draft += info["draft"]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "images": self.images,
+                "average_ms": 1000 * self.total_seconds / self.images if self.images else 0.0,
+                "max_ms": 1000 * self.max_seconds,
+                "downscaled": self.downscaled,
+                "jpeg_draft": self.draft
+            }
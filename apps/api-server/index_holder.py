@@ -0,0 +1,100 @@
+"""
+Contenedor versionado de la galería (double buffering).
+
+La próxima generación se construye aparte, sin tocar la que están leyendo los
+requests, y se publica con un solo reemplazo de referencia. Los lectores toman
+una generación con `acquire()` y la usan hasta terminar aunque se publique otra;
+la generación anterior se retira (se liberan sus referencias) cuando el último
+lector la suelta.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Generation:
+    """Una versión publicada de la galería y sus lectores activos"""
+
+    def __init__(self, number: int, gallery, build_seconds: float = 0.0):
+        self.number = number
+        self.gallery = gallery
+        self.build_seconds = build_seconds
+        self.published_at = time.time()
+        self.rows = len(gallery)
+        self.readers = 0
+        self.retired_at = None
+
+    def describe(self) -> dict:
+        return {
+            "generation": self.number,
+            "rows": self.rows,
+            "build_seconds": self.build_seconds,
+            "published_at": self.published_at,
+            "readers": self.readers
+        }
+
+
+class VersionedIndex:
+    """
+    Publica generaciones de la galería con swap atómico y retira las anteriores
+    cuando no quedan lectores. El lock solo protege contadores: nunca se toma
+    mientras se construye o se busca.
+    """
+
+    def __init__(self, gallery):
+        self._current = Generation(0, gallery)
+        self._draining = []  # Generaciones reemplazadas que todavía tienen lectores
+        self._lock = threading.Lock()
+        self.retired = 0
+
+    @property
+    def current(self) -> Generation:
+        return self._current
+
+    @contextmanager
+    def acquire(self):
+        """Entrega la galería de la generación actual y la mantiene viva hasta salir del bloque"""
+        with self._lock:
+            generation = self._current
+            generation.readers += 1
+            gallery = generation.gallery
+
+        try:
+            yield gallery
+        finally:
+            with self._lock:
+                generation.readers -= 1
+                if generation.readers == 0 and generation in self._draining:
+                    self._retire(generation)
+
+    def publish(self, gallery, build_seconds: float = 0.0) -> Generation:
+        """Reemplaza la generación actual por una nueva ya construida"""
+        with self._lock:
+            previous = self._current
+            if gallery is previous.gallery:
+                return previous
+
+            self._current = Generation(previous.number + 1, gallery, build_seconds)
+
+            if previous.readers:
+                self._draining.append(previous)
+            else:
+                self._retire(previous)
+
+        return self._current
+
+    def _retire(self, generation: Generation):
+        # Se llama con el lock tomado
+        if generation in self._draining:
+            self._draining.remove(generation)
+        generation.gallery = None
+        generation.retired_at = time.time()
+        self.retired += 1
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                **self._current.describe(),
+                "draining": [generation.describe() for generation in self._draining],
+                "retired": self.retired
+            }
@@ -0,0 +1,95 @@
+"""
+Pool de workers para ejecutar la inferencia fuera del event loop.
+
+`DeepFace.represent` es bloqueante; si se llama directo desde un endpoint
+`async def`, una inferencia lenta congela todas las demás conexiones (incluido
+`/health`). El pool la ejecuta en hilos o procesos y limita cuántas tareas
+pueden estar en vuelo: cuando la cola está llena se rechaza la tarea en vez
+de acumular requests sin límite.
+"""
+import asyncio
+import functools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+class InferenceQueueFull(Exception):
+    """La cola de inferencia alcanzó su capacidad máxima"""
+
+
+class InferencePool:
+    """
+    Ejecutor acotado para tareas de inferencia.
+
+    Args:
+        kind: "thread" (comparte el modelo en memoria) o "process" (un modelo por proceso)
+        workers: Cantidad de workers (default: número de CPUs)
+        max_queue: Tareas que pueden esperar además de las que se están ejecutando
+    """
+
+    def __init__(self, kind: str = "thread", workers: int | None = None, max_queue: int = 32):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Tipo de pool inválido: {kind} (usar 'thread' o 'process')")
+
+        self.kind = kind
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.capacity = self.workers + max_queue
+
+        if kind == "process":
+            # spawn: hacer fork de un proceso con TensorFlow cargado no es seguro
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+    @property
+    def in_flight(self) -> int:
+        """Tareas ejecutándose o esperando en la cola"""
+        return self._in_flight
+
+    @property
+    def queue_depth(self) -> int:
+        """Tareas esperando un worker libre"""
+        return max(0, self._in_flight - self.workers)
+
+    def _acquire(self):
+        with self._lock:
+            if self._in_flight >= self.capacity:
+                raise InferenceQueueFull(f"Cola de inferencia llena ({self.capacity} tareas en vuelo)")
+            self._in_flight += 1
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Ejecuta `fn(*args, **kwargs)` en el pool y espera el resultado sin bloquear el event loop.
+        En modo "process", `fn` y sus argumentos deben ser serializables (funciones de módulo).
+        """
+        self._acquire()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+        finally:
+            self._release()
+
+    async def run_on_each_worker(self, fn, *args, **kwargs) -> list:
+        """
+        Ejecuta `fn` una vez por worker en modo "process" (cada proceso carga su
+        propio modelo) o una sola vez en modo "thread" (los hilos comparten memoria).
+        En modo "process" el ejecutor reparte las tareas, así que la cobertura es aproximada.
+        """
+        times = self.workers if self.kind == "process" else 1
+        return await asyncio.gather(*[self.run(fn, *args, **kwargs) for _ in range(times)])
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -4,6 +4,8 @@ import numpy as np
 from supabase import create_client, Client
 from dotenv import load_dotenv
 
+from search_engine import SearchEngine
+
 # Cargar variables de entorno desde .env
 load_dotenv()
 
@@ -38,8 +40,8 @@ def find_match_in_supabase(target_photo_path, threshold=0.6):
     # 2. Descargar encodings de Supabase
     print("Descargando base de datos de rostros desde Supabase...")
     try:
-        # Seleccionamos solo lo necesario
-        response = supabase.table("known_people").select("full_name, face_encoding, linkedin_content").execute()
+        # Solo ids, nombres y vectores: linkedin_content se trae después, únicamente del match
+        response = supabase.table("known_people").select("id, full_name, face_encoding").execute()
         people_db = response.data
         
         if not people_db:
@@ -52,24 +54,27 @@ def find_match_in_supabase(target_photo_path, threshold=0.6):
         print(f"❌ Error conectando con Supabase: {e}")
         return
 
-    # 3. Comparar
+    # 3. Comparar (todas las distancias en una sola operación matricial)
     print("\nComparando...")
-    best_match = None
-    best_dist = float("inf")
-    match_details = None
+    candidates = [
+        person for person in people_db
+        if person.get('face_encoding') and len(person['face_encoding']) == len(target_encoding)
+    ]
 
-    for person in people_db:
-        # Convertir lista JSON a numpy array
-        db_encoding = np.array(person['face_encoding'])
-        
-        # Calcular distancia Euclidiana
-        dist = np.linalg.norm(target_encoding - db_encoding)
+    if not candidates:
+        print(f"⚠️ Ningún perfil tiene embeddings de {len(target_encoding)} dimensiones.")
+        return
+
+    engine = SearchEngine(np.array([person['face_encoding'] for person in candidates], dtype=np.float32))
+    distances = engine.distances(target_encoding)
+
+    for person, dist in zip(candidates, distances):
         print(f" - Distancia con {person['full_name']}: {dist:.4f}")
-        
-        if dist < best_dist:
-            best_dist = dist
-            best_match = person['full_name']
-            match_details = person
+
+    indices, best_distances = engine.search(target_encoding, k=1)
+    best_dist = float(best_distances[0])
+    match_details = candidates[int(indices[0])]
+    best_match = match_details['full_name']
 
     # 4. Resultado
     print("\n========== RESULTADO ==========")
@@ -80,7 +85,8 @@ def find_match_in_supabase(target_photo_path, threshold=0.6):
         print("-" * 20)
         print("Información recuperada:")
         # Mostrar primeras lineas de linkedin content
-        info = match_details.get('linkedin_content', 'Sin información')
+        profile = supabase.table("known_people").select("linkedin_content").eq("id", match_details['id']).execute()
+        info = (profile.data[0].get('linkedin_content') if profile.data else None) or 'Sin información'
         print('\n'.join(info.split('\n')[:5]))
         print("...")
     else:
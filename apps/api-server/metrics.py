@@ -0,0 +1,290 @@
+"""
+Métricas del servidor en el formato de texto de Prometheus, sin dependencias.
+
+- `Histogram` y `Counter` se actualizan en el camino caliente: cada observación
+  es una búsqueda binaria en los buckets y dos sumas bajo un lock, sin asignar
+  memoria salvo la primera vez que aparece una combinación de labels.
+- `CallbackMetric` no guarda estado: lee el valor (tamaño de la galería, caché,
+  cola de inferencia) recién cuando se piden las métricas.
+- `RequestMetricsMiddleware` mide la latencia total de cada request HTTP.
+- `StageHistogram` además acumula cada etapa en los tiempos del request en curso,
+  que `ServerTimingMiddleware` devuelve en el header `Server-Timing`.
+"""
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Segundos: desde la búsqueda en memoria (~1 ms) hasta una inferencia en frío
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Histogram:
+    """Histograma acumulado por combinación de labels (valores en el orden de `labelnames`)"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # labels -> [conteos por bucket (+Inf al final), suma]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        """Observa la duración del bloque"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def collect(self) -> list:
+        with self._lock:
+            snapshot = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+
+        lines = []
+        for labels, counts, total in sorted(snapshot):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class RequestTimings:
+    """Duración acumulada de cada etapa dentro de un request, en orden de aparición"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}  # (nombre, descripción) -> segundos
+
+    def add(self, name: str, seconds: float, description: str = ""):
+        key = (name, description)
+        self.stages[key] = self.stages.get(key, 0.0) + seconds
+
+    def header(self) -> str:
+        """Valor del header Server-Timing (milisegundos), con el total del request al final"""
+        entries = [
+            f'{name};desc="{description}";dur={1000 * seconds:.2f}' if description else f"{name};dur={1000 * seconds:.2f}"
+            for (name, description), seconds in self.stages.items()
+        ]
+        entries.append(f"total;dur={1000 * (time.perf_counter() - self.start):.2f}")
+        return ", ".join(entries)
+
+
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def record_timing(name: str, seconds: float, description: str = ""):
+    """Suma una etapa a los tiempos del request en curso (no hace nada fuera de un request)"""
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.add(name, seconds, description)
+
+
+@contextmanager
+def timed(name: str, description: str = ""):
+    """Mide el bloque como una etapa del request en curso, sin histograma"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(name, time.perf_counter() - start, description)
+
+
+class StageHistogram(Histogram):
+    """
+    Histograma de etapas: cada observación también se suma a los tiempos del request
+    en curso. El primer label es el nombre de la etapa y el segundo, si existe y no
+    está vacío, su descripción (por ejemplo el modelo).
+    """
+
+    def observe(self, value: float, *labels):
+        super().observe(value, *labels)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.add(labels[0], value, labels[1] if len(labels) > 1 else "")
+
+
+class Counter:
+    """Contador monótono por combinación de labels"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def collect(self) -> list:
+        with self._lock:
+            snapshot = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}" for labels, value in snapshot]
+
+
+class CallbackMetric:
+    """
+    Gauge o contador cuyo valor se lee al exportar. `read()` retorna un número o,
+    con labels, un dict {tupla de valores de labels: número}.
+    """
+
+    def __init__(self, name: str, documentation: str, read, kind: str = "gauge", labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+
+    def collect(self) -> list:
+        values = self.read()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [
+            f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+            for labels, value in sorted(values.items())
+            if value is not None
+        ]
+
+
+class Registry:
+    """Conjunto de métricas exportadas por `/metrics`"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def stage_histogram(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> StageHistogram:
+        return self.register(StageHistogram(name, documentation, labelnames, buckets))
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, read, labelnames: tuple = ()) -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, read, "gauge", labelnames))
+
+    def counter_callback(self, name: str, documentation: str, read, labelnames: tuple = ()) -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, read, "counter", labelnames))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                lines.extend(metric.collect())
+            except Exception as e:
+                # Una métrica que falla no debe dejar sin exportar al resto
+                lines.append(f"# {metric.name} no disponible: {_escape(e)}")
+        return "\n".join(lines) + "\n"
+
+
+class RequestMetricsMiddleware:
+    """
+    Middleware ASGI que observa la duración de cada request HTTP en `histogram`
+    con labels (método, ruta, status). La ruta es la plantilla del endpoint
+    (`/match`, no la URL con parámetros) para no crear una serie por URL.
+    """
+
+    def __init__(self, app, histogram: Histogram):
+        self.app = app
+        self.histogram = histogram
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            self.histogram.observe(time.perf_counter() - start, scope["method"], path, str(status[0]))
+
+
+class ServerTimingMiddleware:
+    """
+    Middleware ASGI que abre los tiempos de cada request HTTP y, si algún endpoint
+    registró etapas (con `StageHistogram`, `timed` o `record_timing`), los agrega
+    a la respuesta en el header `Server-Timing` para verlos en las devtools.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _request_timings.set(timings)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and timings.stages:
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timings.header().encode("latin-1")))
+                # Sin este header el navegador oculta los tiempos a otros orígenes (el frontend)
+                headers.append((b"timing-allow-origin", b"*"))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_timings.reset(token)
@@ -0,0 +1,74 @@
+"""
+Agregación de varias muestras (frames) de la misma persona en un solo embedding.
+
+En vez de un upload y una búsqueda por muestra, el cliente envía los N frames
+juntos: se detecta la cara principal de cada uno, se descartan los frames sin
+cara o de baja calidad, se calculan todos los embeddings en un solo batch, se
+descartan los que no se parecen al resto (outliers) y se promedian los vectores
+normalizados. La galería se consulta una sola vez con el promedio.
+"""
+import numpy as np
+
+from face_embedding import detect_faces
+from face_tracking import face_quality
+from quality_gate import QualityThresholds, passed_gate
+
+
+def detect_primary_faces(images: list, thresholds: QualityThresholds | None = None) -> list:
+    """
+    Cara principal (mayor área × confianza) de cada imagen, o None si no hay caras.
+    Con `thresholds` cada detección trae su evaluación de calidad en `quality`.
+    """
+    return [max(detect_faces(image, thresholds), key=face_quality, default=None) for image in images]
+
+
+def select_samples(detections: list, min_quality_ratio: float = 0.5) -> tuple[list, list]:
+    """
+    Retorna (usables, descartadas): índices de las muestras con cara, que pasan el
+    control de calidad (si se evaluó) y con calidad de al menos `min_quality_ratio`
+    veces la mejor que lo pasó, y los descartes como {index, reason}.
+    """
+    qualities = [face_quality(detection) if detection is not None else 0.0 for detection in detections]
+    # La referencia es la mejor muestra usable: una cara grande pero movida no sube la vara
+    best = max(
+        (quality for detection, quality in zip(detections, qualities) if detection is not None and passed_gate(detection)),
+        default=0.0
+    )
+
+    kept, discarded = [], []
+    for index, (detection, quality) in enumerate(zip(detections, qualities)):
+        if detection is None:
+            discarded.append({"index": index, "reason": "no_face"})
+        elif not passed_gate(detection):
+            discarded.append({"index": index, "reason": detection["quality"]["reasons"][0]})
+        elif quality < min_quality_ratio * best:
+            discarded.append({"index": index, "reason": "low_quality"})
+        else:
+            kept.append(index)
+    return kept, discarded
+
+
+def aggregate_embeddings(encodings: np.ndarray, max_outlier_distance: float = 0.4) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Promedia embeddings de la misma persona. Retorna (embedding, máscara de usados).
+
+    Se descartan los que quedan a más de `max_outlier_distance` (distancia coseno) de
+    la mediana por componente, que no se mueve con una muestra mala. El promedio se
+    hace sobre los vectores normalizados y se re-escala a la norma media de las
+    muestras, para que las distancias sigan en la escala de la galería.
+    """
+    encodings = np.asarray(encodings, dtype=np.float32)
+    norms = np.linalg.norm(encodings, axis=1, keepdims=True)
+    unit = encodings / np.maximum(norms, 1e-12)
+
+    reference = np.median(unit, axis=0)
+    reference /= max(float(np.linalg.norm(reference)), 1e-12)
+    cosine_distance = 1.0 - unit @ reference
+
+    keep = cosine_distance <= max_outlier_distance
+    if not keep.any():
+        keep[int(np.argmin(cosine_distance))] = True
+
+    mean = unit[keep].mean(axis=0)
+    mean /= max(float(np.linalg.norm(mean)), 1e-12)
+    return mean * float(norms[keep].mean()), keep
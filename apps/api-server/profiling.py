@@ -0,0 +1,147 @@
+"""
+Diagnóstico de un worker en producción, sin reiniciarlo.
+
+- CPU: profiler por muestreo. Cada `interval` segundos lee la pila de todos los
+  hilos (`sys._current_frames`) y cuenta cuántas veces aparece cada pila. El costo
+  es una lectura de pilas por muestra, así que se puede correr con tráfico real.
+  La salida es el formato "collapsed" (una pila por línea, funciones separadas
+  por `;` y la cantidad de muestras al final) que leen flamegraph.pl y speedscope.
+- Memoria: snapshots de tracemalloc con las líneas que más memoria retienen y la
+  diferencia contra el snapshot anterior (para ver qué crece entre dos pedidos).
+
+Solo se ve el proceso del servidor: con INFERENCE_EXECUTOR=process la inferencia
+corre en otros procesos.
+"""
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+
+# Funciones donde un hilo está esperando (locks, colas, el selector del event loop), no usando CPU
+IDLE_FUNCTIONS = {
+    ("threading", "wait"),
+    ("threading", "_wait_for_tstate_lock"),
+    ("selectors", "select"),
+    ("queue", "get"),
+    ("concurrent.futures.thread", "_worker")
+}
+
+
+class ProfilerBusy(Exception):
+    """Ya hay un perfil de CPU en curso en este worker"""
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", code.co_filename)
+    return f"{module}:{code.co_name}:{frame.f_lineno}"
+
+
+def _collapse(frame, thread_name: str) -> str:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.append(thread_name)
+    return ";".join(reversed(labels))
+
+
+class SamplingProfiler:
+    """Profiler de CPU por muestreo; un solo perfil a la vez por worker"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def profile(self, seconds: float, interval: float = 0.005, include_idle: bool = False) -> dict:
+        """
+        Muestrea las pilas de todos los hilos durante `seconds` (bloquea el hilo que
+        lo llama). Sin `include_idle` se omiten los hilos que están esperando.
+        Retorna {"samples", "seconds", "stacks": Counter(pila -> muestras)}.
+        """
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("Ya hay un perfil de CPU en curso")
+
+        try:
+            own_thread = threading.get_ident()
+            stacks = Counter()
+            samples = 0
+            start = time.perf_counter()
+            deadline = start + seconds
+
+            while time.perf_counter() < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_thread:
+                        continue
+                    if not include_idle and (frame.f_globals.get("__name__"), frame.f_code.co_name) in IDLE_FUNCTIONS:
+                        continue
+                    stacks[_collapse(frame, names.get(thread_id, str(thread_id)))] += 1
+                samples += 1
+                time.sleep(interval)
+
+            return {"samples": samples, "seconds": time.perf_counter() - start, "stacks": stacks}
+        finally:
+            self._lock.release()
+
+
+def collapsed(stacks: Counter) -> str:
+    """Pilas en formato collapsed, de la más frecuente a la menos frecuente"""
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+class MemoryTracker:
+    """Snapshots de tracemalloc con diferencia contra el anterior"""
+
+    def __init__(self):
+        self._previous = None
+        self._lock = threading.Lock()
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = 1):
+        # tracemalloc agrega costo a cada asignación: solo se activa a pedido
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self._previous = None
+
+    def stop(self):
+        tracemalloc.stop()
+        self._previous = None
+
+    def snapshot(self, top: int = 25, group_by: str = "lineno") -> dict:
+        """Las `top` ubicaciones que más memoria retienen y las que más crecieron desde el snapshot anterior"""
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc no está activo")
+
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+
+        with self._lock:
+            previous, self._previous = self._previous, snapshot
+
+        result = {
+            "traced_bytes": current,
+            "peak_bytes": peak,
+            "group_by": group_by,
+            "top": [
+                {"location": str(stat.traceback), "size_bytes": stat.size, "count": stat.count}
+                for stat in snapshot.statistics(group_by)[:top]
+            ],
+            "growth": None
+        }
+
+        if previous is not None:
+            result["growth"] = [
+                {"location": str(stat.traceback), "size_diff_bytes": stat.size_diff, "count_diff": stat.count_diff}
+                for stat in snapshot.compare_to(previous, group_by)[:top]
+                if stat.size_diff
+            ]
+
+        return result
@@ -0,0 +1,155 @@
+"""
+Control de calidad de la cara antes de calcular el embedding.
+
+Usa solo lo que ya entrega el detector (recorte de la cara, caja y ojos), así que
+cuesta una fracción de milisegundo frente al forward pass de Facenet512. Se mide:
+- Tamaño: lado menor de la caja detectada, en píxeles.
+- Nitidez: varianza del Laplaciano del recorte (baja = movida o desenfocada).
+- Brillo: promedio de gris del recorte (0-255).
+- Pose: inclinación de la línea de los ojos (roll) y corrimiento horizontal del
+  punto medio de los ojos respecto del centro de la caja (aproxima el giro, yaw).
+  Si el detector no entrega los ojos, la pose no se evalúa.
+
+Las caras que no pasan se descartan antes de llegar al modelo.
+"""
+import math
+import threading
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+REJECT_REASONS = ("no_face", "too_small", "blurry", "too_dark", "too_bright", "off_angle")
+SHARPNESS_SIZE = 112  # La nitidez se mide con el recorte llevado a este tamaño, para comparar caras de distinto tamaño
+
+
+@dataclass(frozen=True)
+class QualityThresholds:
+    """Límites del control de calidad"""
+    min_face_size: int = 60
+    min_sharpness: float = 30.0
+    min_brightness: float = 40.0
+    max_brightness: float = 220.0
+    max_roll_degrees: float = 25.0
+    max_yaw_offset: float = 0.2  # Corrimiento de los ojos respecto del centro, relativo al ancho de la caja
+
+
+class LowQualityFace(Exception):
+    """La cara detectada no pasa el control de calidad; `assessment` tiene los motivos y las medidas"""
+
+    def __init__(self, assessment: dict):
+        super().__init__(assessment)
+        self.assessment = assessment
+
+    def __str__(self):
+        return f"Calidad de cara insuficiente: {', '.join(self.assessment['reasons'])}"
+
+
+def _sharpness(face: np.ndarray) -> float:
+    import cv2
+
+    gray = cv2.cvtColor(np.asarray(face, dtype=np.float32), cv2.COLOR_RGB2GRAY)
+    gray = cv2.resize(gray, (SHARPNESS_SIZE, SHARPNESS_SIZE), interpolation=cv2.INTER_AREA)
+    return float(cv2.Laplacian(gray * 255.0, cv2.CV_32F).var())
+
+
+def _pose(area: dict) -> tuple[float | None, float | None]:
+    left_eye, right_eye = area.get("left_eye"), area.get("right_eye")
+    if not left_eye or not right_eye:
+        return None, None
+
+    dx = float(right_eye[0]) - float(left_eye[0])
+    dy = float(right_eye[1]) - float(left_eye[1])
+    roll = abs(math.degrees(math.atan2(dy, dx)))
+    # El orden de los ojos depende del detector: la inclinación se mide sobre la recta
+    roll = min(roll, 180.0 - roll)
+
+    eyes_center = (float(left_eye[0]) + float(right_eye[0])) / 2
+    box_center = float(area["x"]) + float(area["w"]) / 2
+    yaw_offset = abs(eyes_center - box_center) / max(float(area["w"]), 1.0)
+    return roll, yaw_offset
+
+
+def assess_face(face: dict, thresholds: QualityThresholds) -> dict:
+    """
+    Evalúa una cara de `DeepFace.extract_faces` (recorte RGB en [0, 1], `facial_area`
+    y `confidence`). Retorna {"passed", "reasons", "scores", "seconds"}.
+    """
+    start = time.perf_counter()
+
+    if float(face.get("confidence") or 0.0) <= 0:
+        # Sin detecciones, extract_faces retorna la imagen completa con confianza 0
+        return {"passed": False, "reasons": ["no_face"], "scores": {}, "seconds": time.perf_counter() - start}
+
+    area = face["facial_area"]
+    crop = face["face"]
+    brightness = float(np.mean(crop)) * 255.0
+    roll, yaw_offset = _pose(area)
+
+    scores = {
+        "face_size": int(min(area["w"], area["h"])),
+        "sharpness": _sharpness(crop),
+        "brightness": brightness,
+        "roll_degrees": roll,
+        "yaw_offset": yaw_offset
+    }
+
+    reasons = []
+    if scores["face_size"] < thresholds.min_face_size:
+        reasons.append("too_small")
+    if scores["sharpness"] < thresholds.min_sharpness:
+        reasons.append("blurry")
+    if brightness < thresholds.min_brightness:
+        reasons.append("too_dark")
+    if brightness > thresholds.max_brightness:
+        reasons.append("too_bright")
+    if roll is not None and (roll > thresholds.max_roll_degrees or yaw_offset > thresholds.max_yaw_offset):
+        reasons.append("off_angle")
+
+    return {"passed": not reasons, "reasons": reasons, "scores": scores, "seconds": time.perf_counter() - start}
+
+
+def passed_gate(detection: dict) -> bool:
+    """True si la detección pasó el control de calidad o no se evaluó"""
+    return "quality" not in detection or detection["quality"]["passed"]
+
+
+class QualityStats:
+    """Caras evaluadas, descartadas por motivo y costo promedio de cada etapa"""
+
+    STAGES = ("detect", "quality", "embed")
+
+    def __init__(self):
+        self.checked = 0
+        self.rejected = dict.fromkeys(REJECT_REASONS, 0)
+        self.skipped = 0
+        self.seconds = dict.fromkeys(self.STAGES, 0.0)
+        self.runs = dict.fromkeys(self.STAGES, 0)
+        self._lock = threading.Lock()
+
+    def record(self, assessment: dict):
+        with self._lock:
+            self.checked += 1
+            self.skipped += not assessment["passed"]
+            for reason in assessment["reasons"]:
+                self.rejected[reason] += 1
+            self.runs["quality"] += 1
+            self.seconds["quality"] += assessment["seconds"]
+
+    def record_stage(self, stage: str, seconds: float):
+        with self._lock:
+            self.runs[stage] += 1
+            self.seconds[stage] += seconds
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "checked": self.checked,
+                "skipped": self.skipped,
+                "skip_rate": self.skipped / self.checked if self.checked else 0.0,
+                "rejected_by_reason": dict(self.rejected),
+                "average_ms": {
+                    stage: 1000 * self.seconds[stage] / self.runs[stage] if self.runs[stage] else 0.0
+                    for stage in self.STAGES
+                }
+            }
@@ -0,0 +1,300 @@
+"""
+Representaciones comprimidas de la galería con re-ranking exacto.
+
+- `Float16Index`: guarda los vectores en float16 (2 bytes por dimensión, la mitad de float32).
+- `PQIndex`: product quantization. Divide cada vector en `m` subvectores y guarda
+  solo el id (1 byte) del centroide más cercano de cada uno: 512 dims -> 64 bytes.
+
+La búsqueda corre sobre los códigos comprimidos y solo los `rerank` mejores
+candidatos se re-ordenan con distancias exactas contra los vectores float32
+originales (`rerank_source`, que puede ser un array en memoria o un memmap).
+
+Solo ahorran memoria si `rerank_source` es el memmap del snapshot: con la matriz
+float32 en el heap, los códigos se suman a ella en vez de reemplazarla.
+"""
+import copy
+import mmap
+import time
+
+import numpy as np
+
+from ann_index import kmeans
+from search_engine import SearchEngine
+
+STORAGE_MODES = ("float32", "float16", "pq")
+
+
+def is_mapped(array) -> bool:
+    """True si `array` es un memmap o una vista de uno"""
+    base = array
+    while base is not None:
+        if isinstance(base, (np.memmap, mmap.mmap)):
+            return True
+        base = getattr(base, "base", None)
+    return False
+
+
+def heap_nbytes(array) -> int:
+    """
+    Bytes de `array` en el heap del proceso. Un memmap cuenta 0: sus páginas son del
+    page cache, se comparten entre workers y solo se cargan las que se leen.
+    """
+    if array is None or is_mapped(array):
+        return 0
+    return array.nbytes
+
+
+def _top_k(sq_dist: np.ndarray, k: int) -> np.ndarray:
+    """Posiciones de las k distancias más chicas, ordenadas"""
+    k = min(k, len(sq_dist))
+    top = np.argpartition(sq_dist, k - 1)[:k] if k < len(sq_dist) else np.arange(len(sq_dist))
+    return top[np.argsort(sq_dist[top], kind="stable")]
+
+
+def _rerank(query: np.ndarray, candidates: np.ndarray, rerank_source, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Distancias exactas contra los vectores originales, solo para los candidatos"""
+    # Orden ascendente: lecturas secuenciales si la fuente es un memmap
+    candidates = np.sort(candidates)
+    vectors = np.asarray(rerank_source[candidates], dtype=np.float32)
+    dists = np.linalg.norm(vectors - query, axis=1)
+    top = _top_k(dists, k)
+    return candidates[top], dists[top]
+
+
+class Float16Index:
+    """
+    Búsqueda sobre vectores float16. El producto se calcula por bloques convertidos
+    a float32 (NumPy no usa BLAS con float16) para no duplicar toda la matriz.
+    La conversión cuesta CPU: conviene cuando la memoria, y no la latencia, es el límite.
+    """
+
+    def __init__(self, embeddings: np.ndarray, rerank_source=None, rerank: int = 32, block_size: int = 1024):
+        self.vectors = np.ascontiguousarray(embeddings, dtype=np.float16)
+        self.sq_norms = np.einsum("ij,ij->i", self.vectors, self.vectors, dtype=np.float32)
+        self.rerank_source = rerank_source
+        self.rerank = rerank
+        self.block_size = block_size
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    @property
+    def dimensions(self) -> int:
+        return self.vectors.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        """Memoria de los códigos float16 (sin la fuente de re-ranking, ver `rerank_nbytes`)"""
+        return self.vectors.nbytes + self.sq_norms.nbytes
+
+    @property
+    def rerank_nbytes(self) -> int:
+        """Memoria en el heap de la fuente de re-ranking (0 si es un memmap)"""
+        return heap_nbytes(self.rerank_source)
+
+    def extended(self, embeddings: np.ndarray, start: int) -> "Float16Index":
+        """Índice nuevo con las filas [start:] de `embeddings` agregadas (re-ranking contra `embeddings`)"""
+        index = copy.copy(self)
+        new_rows = np.asarray(embeddings[start:], dtype=np.float16)
+        index.vectors = np.ascontiguousarray(np.vstack([self.vectors, new_rows]))
+        index.sq_norms = np.concatenate([self.sq_norms, np.einsum("ij,ij->i", new_rows, new_rows, dtype=np.float32)])
+        if self.rerank_source is not None:
+            index.rerank_source = embeddings
+        return index
+
+    def search(self, query, k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        if len(self) == 0 or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        query = np.asarray(query, dtype=np.float32).ravel()
+        if query.shape[0] != self.dimensions:
+            raise ValueError(f"Dimensiones no coinciden. Índice: {self.dimensions}, Query: {query.shape[0]}")
+
+        dots = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), self.block_size):
+            block = self.vectors[start:start + self.block_size].astype(np.float32)
+            dots[start:start + len(block)] = block @ query
+
+        sq_dist = self.sq_norms - 2.0 * dots + float(query @ query)
+        np.maximum(sq_dist, 0.0, out=sq_dist)
+
+        if self.rerank_source is None:
+            top = _top_k(sq_dist, k)
+            return top, np.sqrt(sq_dist[top])
+
+        candidates = _top_k(sq_dist, max(k, self.rerank))
+        return _rerank(query, candidates, self.rerank_source, k)
+
+
+class PQIndex:
+    """
+    Product quantization con distancias asimétricas (ADC): la consulta queda en
+    float32 y se compara contra los centroides de cada subespacio con una tabla.
+
+    Args:
+        dimensions: Dimensión de los embeddings (debe ser múltiplo de `m`)
+        m: Cantidad de subespacios (bytes por vector)
+        rerank_source: Vectores float32 originales para re-ranking exacto (opcional)
+        rerank: Candidatos que se re-ordenan con distancias exactas
+    """
+
+    def __init__(self, dimensions: int, m: int = 64, rerank_source=None, rerank: int = 64):
+        if dimensions % m != 0:
+            raise ValueError(f"Las dimensiones ({dimensions}) deben ser múltiplo de m ({m})")
+
+        self._dimensions = dimensions
+        self.m = m
+        self.sub_dim = dimensions // m
+        self.rerank_source = rerank_source
+        self.rerank = rerank
+
+        self.codebooks = None  # (m, 256, sub_dim)
+        # Códigos guardados por subespacio (m, n): cada lookup recorre memoria contigua
+        self.codes = np.empty((m, 0), dtype=np.uint8)
+
+    def __len__(self):
+        return self.codes.shape[1]
+
+    @property
+    def dimensions(self) -> int:
+        return self._dimensions
+
+    @property
+    def nbytes(self) -> int:
+        """Memoria de los códigos y codebooks (sin la fuente de re-ranking, ver `rerank_nbytes`)"""
+        codebooks = self.codebooks.nbytes if self.codebooks is not None else 0
+        return self.codes.nbytes + codebooks
+
+    @property
+    def rerank_nbytes(self) -> int:
+        """Memoria en el heap de la fuente de re-ranking (0 si es un memmap)"""
+        return heap_nbytes(self.rerank_source)
+
+    def train(self, vectors: np.ndarray, iterations: int = 15, max_train_size: int = 65536, seed: int = 0):
+        """Entrena un codebook de hasta 256 centroides por subespacio"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(vectors) > max_train_size:
+            rng = np.random.default_rng(seed)
+            vectors = vectors[rng.choice(len(vectors), size=max_train_size, replace=False)]
+
+        ksub = min(256, len(vectors))
+        self.codebooks = np.zeros((self.m, 256, self.sub_dim), dtype=np.float32)
+
+        for j in range(self.m):
+            sub = vectors[:, j * self.sub_dim:(j + 1) * self.sub_dim]
+            centroids = kmeans(sub, ksub, iterations=iterations, seed=seed + j)
+            self.codebooks[j, :len(centroids)] = centroids
+            # Con menos de 256 vectores de entrenamiento, los centroides sobrantes repiten el primero
+            self.codebooks[j, len(centroids):] = centroids[0]
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """Códigos PQ de los vectores, con forma (m, n)"""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dimensions)
+        codes = np.empty((self.m, len(vectors)), dtype=np.uint8)
+
+        for j in range(self.m):
+            sub = vectors[:, j * self.sub_dim:(j + 1) * self.sub_dim]
+            book = self.codebooks[j]
+            sq_dist = (
+                np.einsum("ij,ij->i", sub, sub)[:, np.newaxis]
+                - 2.0 * (sub @ book.T)
+                + np.einsum("ij,ij->i", book, book)[np.newaxis, :]
+            )
+            codes[j] = np.argmin(sq_dist, axis=1)
+
+        return codes
+
+    def add(self, vectors: np.ndarray):
+        if self.codebooks is None:
+            raise RuntimeError("El índice PQ debe entrenarse antes de agregar vectores")
+        self.codes = np.ascontiguousarray(np.hstack([self.codes, self.encode(vectors)]))
+
+    def extended(self, embeddings: np.ndarray, start: int) -> "PQIndex":
+        """Índice nuevo con las filas [start:] de `embeddings` codificadas (sin reentrenar)"""
+        index = copy.copy(self)
+        index.add(embeddings[start:])
+        if self.rerank_source is not None:
+            index.rerank_source = embeddings
+        return index
+
+    def search(self, query, k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        if len(self) == 0 or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        query = np.asarray(query, dtype=np.float32).ravel()
+        if query.shape[0] != self.dimensions:
+            raise ValueError(f"Dimensiones no coinciden. Índice: {self.dimensions}, Query: {query.shape[0]}")
+
+        # Tabla (m, 256): distancia de cada subvector de la consulta a cada centroide
+        sub_queries = query.reshape(self.m, 1, self.sub_dim)
+        table = np.sum((self.codebooks - sub_queries) ** 2, axis=2)
+
+        # Distancia aproximada = suma de las entradas de la tabla indicadas por los códigos
+        sq_dist = np.zeros(len(self), dtype=np.float32)
+        for j in range(self.m):
+            sq_dist += table[j][self.codes[j]]
+
+        if self.rerank_source is None:
+            top = _top_k(sq_dist, k)
+            return top, np.sqrt(sq_dist[top])
+
+        candidates = _top_k(sq_dist, max(k, self.rerank))
+        return _rerank(query, candidates, self.rerank_source, k)
+
+
+def build_compressed_index(embeddings: np.ndarray, storage: str = "float32", pq_m: int = 64, rerank: int = 64):
+    """
+    Construye el índice exacto o comprimido para `embeddings`. Los índices
+    comprimidos re-ordenan con `embeddings` como fuente de precisión completa
+    (debe ser el memmap del snapshot para que la compresión ahorre memoria).
+    """
+    if storage not in STORAGE_MODES:
+        raise ValueError(f"Modo de almacenamiento inválido: {storage} (usar {', '.join(STORAGE_MODES)})")
+
+    if storage == "float16":
+        return Float16Index(embeddings, rerank_source=embeddings, rerank=rerank)
+
+    if storage == "pq" and len(embeddings) > 0:
+        index = PQIndex(embeddings.shape[1], m=pq_m, rerank_source=embeddings, rerank=rerank)
+        index.train(embeddings)
+        index.add(embeddings)
+        return index
+
+    return SearchEngine(embeddings)
+
+
+def compare_storage_modes(embeddings: np.ndarray, queries: np.ndarray, k: int = 10, pq_m: int = 64, rerank: int = 64) -> list:
+    """
+    Construye la galería en cada modo de almacenamiento y reporta bytes por
+    persona, latencia promedio por consulta (ms) y recall@k contra float32.
+
+    `bytes_per_person` es la memoria que el modo ocupa en el heap: el índice más la
+    fuente de re-ranking si no es un memmap (`embeddings` se usa como esa fuente,
+    así que el reporte refleja de dónde viene la galería en este proceso).
+    """
+    exact = SearchEngine(embeddings)
+    ground_truth = [exact.search(query, k)[0] for query in queries]
+    report = []
+
+    for storage in STORAGE_MODES:
+        index = build_compressed_index(embeddings, storage, pq_m=pq_m, rerank=rerank)
+
+        start = time.perf_counter()
+        results = [index.search(query, k)[0] for query in queries]
+        elapsed = time.perf_counter() - start
+
+        hits = sum(len(np.intersect1d(found, truth)) for found, truth in zip(results, ground_truth))
+        people = max(1, len(index))
+        rerank_source = getattr(index, "rerank_source", None)
+        rerank_bytes = getattr(index, "rerank_nbytes", 0)
+        report.append({
+            "storage": storage,
+            "bytes_per_person": (index.nbytes + rerank_bytes) / people,
+            "index_bytes_per_person": index.nbytes / people,
+            "rerank_bytes_per_person": rerank_bytes / people,
+            "rerank_source": None if rerank_source is None else ("mmap" if is_mapped(rerank_source) else "heap"),
+            "search_ms": 1000 * elapsed / max(1, len(queries)),
+            "recall_at_k": hits / max(1, len(queries) * k)
+        })
+
+    return report
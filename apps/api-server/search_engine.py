@@ -0,0 +1,128 @@
+"""
+Búsqueda exacta de vecinos más cercanos sobre una matriz de embeddings.
+
+Todos los vectores se guardan en una sola matriz float32 con sus normas al
+cuadrado precalculadas, así la distancia Euclidiana a la consulta se obtiene
+con un único producto matriz-vector (BLAS):
+
+    ||x - q||² = ||x||² - 2·x·q + ||q||²
+"""
+import numpy as np
+
+
+class SearchEngine:
+    """Índice de búsqueda exacta (fuerza bruta vectorizada) por distancia Euclidiana"""
+
+    def __init__(self, embeddings: np.ndarray, sq_norms: np.ndarray | None = None):
+        self.embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if self.embeddings.ndim != 2:
+            raise ValueError(f"Se esperaba una matriz 2D de embeddings, shape recibido: {self.embeddings.shape}")
+
+        # ||x||² de cada fila
+        if sq_norms is None:
+            sq_norms = np.einsum("ij,ij->i", self.embeddings, self.embeddings)
+        self.sq_norms = sq_norms
+
+    def __len__(self):
+        return self.embeddings.shape[0]
+
+    @property
+    def dimensions(self) -> int:
+        return self.embeddings.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        """Memoria usada por el índice"""
+        return self.embeddings.nbytes + self.sq_norms.nbytes
+
+    def _as_query(self, query) -> np.ndarray:
+        query = np.asarray(query, dtype=np.float32).ravel()
+        if query.shape[0] != self.dimensions:
+            raise ValueError(f"Dimensiones no coinciden. Índice: {self.dimensions}, Query: {query.shape[0]}")
+        return query
+
+    def distances(self, query) -> np.ndarray:
+        """Distancia Euclidiana de la consulta a todos los vectores (un solo GEMV)"""
+        query = self._as_query(query)
+        sq_dist = self.sq_norms - 2.0 * (self.embeddings @ query) + float(query @ query)
+        # Errores de redondeo pueden dejar valores levemente negativos
+        np.maximum(sq_dist, 0.0, out=sq_dist)
+        return np.sqrt(sq_dist)
+
+    def search(self, query, k: int = 1, exclude: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Retorna (índices, distancias) de los k vectores más cercanos, ordenados
+        de menor a mayor distancia. Usa argpartition para no ordenar toda la galería.
+        Los índices en `exclude` (sin repetir) quedan en inf y nunca se retornan.
+        """
+        excluded = 0 if exclude is None else len(exclude)
+        n = len(self)
+        k = min(k, n - excluded)
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        dists = self.distances(query)
+        if excluded:
+            dists[exclude] = np.inf
+
+        if k < n:
+            candidates = np.argpartition(dists, k - 1)[:k]
+        else:
+            candidates = np.arange(n)
+
+        order = candidates[np.argsort(dists[candidates], kind="stable")]
+        return order, dists[order]
+
+    def search_batch(self, queries, k: int = 1, exclude: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Búsqueda de varias consultas a la vez con un solo producto matriz-matriz (GEMM).
+        Retorna (índices, distancias) con forma (consultas, k), ordenados por fila.
+        Los índices en `exclude` (sin repetir) quedan en inf y nunca se retornan.
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dimensions)
+        excluded = 0 if exclude is None else len(exclude)
+        n = len(self)
+        k = min(k, n - excluded)
+        if k <= 0 or len(queries) == 0:
+            return np.empty((len(queries), 0), dtype=np.int64), np.empty((len(queries), 0), dtype=np.float32)
+
+        sq_dist = (
+            self.sq_norms[np.newaxis, :]
+            - 2.0 * (queries @ self.embeddings.T)
+            + np.einsum("ij,ij->i", queries, queries)[:, np.newaxis]
+        )
+        np.maximum(sq_dist, 0.0, out=sq_dist)
+        if excluded:
+            sq_dist[:, exclude] = np.inf
+
+        if k < n:
+            candidates = np.argpartition(sq_dist, k - 1, axis=1)[:, :k]
+        else:
+            candidates = np.tile(np.arange(n), (len(queries), 1))
+
+        order = np.argsort(np.take_along_axis(sq_dist, candidates, axis=1), axis=1, kind="stable")
+        indices = np.take_along_axis(candidates, order, axis=1)
+        return indices, np.sqrt(np.take_along_axis(sq_dist, indices, axis=1))
+
+    def extended(self, embeddings: np.ndarray, start: int) -> "SearchEngine":
+        """
+        Retorna un índice nuevo sobre `embeddings`, cuyas filas [start:] son nuevas.
+        Reutiliza las normas ya calculadas; el índice actual no se modifica.
+        """
+        new_rows = np.asarray(embeddings[start:], dtype=np.float32)
+        sq_norms = np.concatenate([self.sq_norms[:start], np.einsum("ij,ij->i", new_rows, new_rows)])
+        return SearchEngine(embeddings, sq_norms=sq_norms)
+
+    def add(self, vectors: np.ndarray):
+        """Agrega vectores al final del índice (sus posiciones continúan la numeración)"""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dimensions)
+        self.embeddings = np.ascontiguousarray(np.vstack([self.embeddings, vectors]))
+        self.sq_norms = np.concatenate([self.sq_norms, np.einsum("ij,ij->i", vectors, vectors)])
+
+    def save(self, path: str):
+        np.savez(path, kind="flat", embeddings=self.embeddings)
+
+    @classmethod
+    def load(cls, path: str) -> "SearchEngine":
+        with np.load(path) as data:
+            return cls(data["embeddings"])
@@ -5,40 +5,6 @@ export const dynamic = 'force-dynamic';
 // URL del api_server.py local para calcular embeddings (DeepFace es Python)
 const API_SERVER_URL = process.env.API_SERVER_URL || 'http://localhost:8000';
 
-// Función para calcular distancia euclidiana
-function calculateEuclideanDistance(descriptor1: number[], descriptor2: number[]): number {
-  if (descriptor1.length !== descriptor2.length) {
-    throw new Error('Descriptors must have the same length');
-  }
-
-  let sum = 0;
-  for (let i = 0; i < descriptor1.length; i++) {
-    const diff = descriptor1[i] - descriptor2[i];
-    sum += diff * diff;
-  }
-
-  return Math.sqrt(sum);
-}
-
-// Función para promediar múltiples embeddings
-function averageEmbeddings(embeddings: number[][]): number[] {
-  if (embeddings.length === 0) return [];
-  if (embeddings.length === 1) return embeddings[0];
-
-  const length = embeddings[0].length;
-  const averaged = new Array(length).fill(0);
-
-  for (let i = 0; i < length; i++) {
-    let sum = 0;
-    for (const embedding of embeddings) {
-      sum += embedding[i];
-    }
-    averaged[i] = sum / embeddings.length;
-  }
-
-  return averaged;
-}
-
 export async function POST(request: NextRequest) {
   try {
     const body = await request.json();
@@ -64,9 +30,11 @@ export async function POST(request: NextRequest) {
 
     console.log(`[DeepFace 512] Processing ${imagesToProcess.length} image(s)...`);
 
-    // Paso 1: Calcular embeddings de 512 dimensiones para cada imagen usando api_server.py local
-    const embeddings: number[][] = [];
-    
+    // Paso 1: Enviar todas las muestras al api_server.py en un solo request. El servidor
+    // calcula los embeddings en un batch, descarta muestras sin cara, de baja calidad
+    // u outliers, promedia el resto y busca en la galería una sola vez
+    const formData = new FormData();
+
     for (let i = 0; i < imagesToProcess.length; i++) {
       const img = imagesToProcess[i];
       if (typeof img !== 'string') {
@@ -74,110 +42,66 @@ export async function POST(request: NextRequest) {
         continue;
       }
 
-      try {
-        // Convertir imagen base64 a FormData para enviar al api_server
-        const formData = new FormData();
-        
-        // Convertir base64 a blob
-        const base64Data = img.includes(',') ? img.split(',')[1] : img;
-        const byteCharacters = atob(base64Data);
-        const byteNumbers = new Array(byteCharacters.length);
-        for (let j = 0; j < byteCharacters.length; j++) {
-          byteNumbers[j] = byteCharacters.charCodeAt(j);
-        }
-        const byteArray = new Uint8Array(byteNumbers);
-        const blob = new Blob([byteArray], { type: 'image/jpeg' });
-        
-        formData.append('file', blob, `face_${i}.jpg`);
-
-        // Llamar al api_server.py para calcular el embedding
-        const apiResponse = await fetch(`${API_SERVER_URL}/calculate-embedding`, {
-          method: 'POST',
-          body: formData,
-        });
-
-        if (!apiResponse.ok) {
-          const errorText = await apiResponse.text();
-          console.error(`[DeepFace 512] Error calculating embedding for image ${i}: ${apiResponse.status} - ${errorText}`);
-          continue;
-        }
-
-        const apiResult = await apiResponse.json();
-        if (apiResult.embedding && Array.isArray(apiResult.embedding)) {
-          embeddings.push(apiResult.embedding);
-          console.log(`[DeepFace 512] Embedding ${i + 1}/${imagesToProcess.length} calculated: ${apiResult.embedding.length} dimensions`);
-        }
-      } catch (error) {
-        console.error(`[DeepFace 512] Error calculating embedding for image ${i}:`, error);
-        continue;
+      // Convertir base64 a blob
+      const base64Data = img.includes(',') ? img.split(',')[1] : img;
+      const byteCharacters = atob(base64Data);
+      const byteNumbers = new Array(byteCharacters.length);
+      for (let j = 0; j < byteCharacters.length; j++) {
+        byteNumbers[j] = byteCharacters.charCodeAt(j);
       }
+      const byteArray = new Uint8Array(byteNumbers);
+      formData.append('files', new Blob([byteArray], { type: 'image/jpeg' }), `face_${i}.jpg`);
     }
 
-    if (embeddings.length === 0) {
-      return NextResponse.json(
-        {
-          error: 'Error calculating embeddings',
-          match_found: false,
-          person_name: null,
-          distance: null,
-          method: 'deepface_512',
-          threshold,
-          message: 'No se pudieron calcular embeddings válidos. Asegúrate de que api_server.py esté corriendo en ' + API_SERVER_URL
-        },
-        { status: 500 }
-      );
-    }
+    formData.append('k', '3');
+    formData.append('threshold', String(threshold));
 
-    // Paso 2: Promediar los embeddings capturados
-    const faceDescriptor = averageEmbeddings(embeddings);
-    console.log(`[DeepFace 512] Averaged embedding calculated from ${embeddings.length} image(s): ${faceDescriptor.length} dimensions`);
+    // Paso 2: El servidor retorna los candidatos más cercanos al promedio
+    // (ya tiene los embeddings en memoria y verifica mejor vs segundo mejor)
+    const searchResponse = await fetch(`${API_SERVER_URL}/match/samples`, {
+      method: 'POST',
+      body: formData,
+    });
 
-    // Paso 2: Obtener embeddings de 512 dimensiones desde Supabase
-    const { createClient } = await import('@supabase/supabase-js');
-    
-    const supabaseUrl = process.env.NEXT_PUBLIC_SUPABASE_URL || 'https://zgvntpcrofqtmuktrqjs.supabase.co';
-    const supabaseKey = process.env.NEXT_PUBLIC_SUPABASE_ANON_KEY;
-    
-    if (!supabaseKey) {
+    if (!searchResponse.ok) {
+      const errorText = await searchResponse.text();
+      console.error(`[DeepFace 512] Search error: ${searchResponse.status} - ${errorText}`);
       return NextResponse.json(
         {
-          error: 'Supabase key not configured',
+          error: 'Search error',
           match_found: false,
           person_name: null,
           distance: null,
           method: 'deepface_512',
           threshold,
-          message: 'NEXT_PUBLIC_SUPABASE_ANON_KEY no está configurada'
+          message: `Error al procesar las muestras: ${errorText}. Asegúrate de que api_server.py esté corriendo en ${API_SERVER_URL}`
         },
-        { status: 500 }
+        // 400/422: muestras inválidas o que no pasaron el control de calidad (error del cliente, no del servidor)
+        { status: [400, 422].includes(searchResponse.status) ? searchResponse.status : 500 }
       );
     }
-    
-    const supabase = createClient(supabaseUrl, supabaseKey);
 
-    // Obtener todas las personas conocidas con embedding de 512 dimensiones
-    const { data: knownPeople, error } = await supabase
-      .from('known_people')
-      .select('id, full_name, face_encoding, face_encoding_deepface_512, linkedin_content, discord_username, photo_path, label')
-      .or('face_encoding.not.is.null,face_encoding_deepface_512.not.is.null');
+    const searchResult = await searchResponse.json();
+    console.log(
+      `[DeepFace 512] Averaged ${searchResult.samples_used}/${searchResult.samples_received} sample(s) (discarded: ${searchResult.discarded.length})`
+    );
 
-    if (error) {
-      console.error('[DeepFace 512] Supabase error:', error);
-      return NextResponse.json(
-        {
-          error: 'Database error',
-          match_found: false,
-          person_name: null,
-          distance: null,
-          method: 'deepface_512',
-          threshold,
-          message: `Error al consultar la base de datos: ${error.message}`
-        },
-        { status: 500 }
-      );
+    // Desglose por etapa del api_server (decode, detect, embed, search...): se loguea y se
+    // reenvía al navegador para verlo en la pestaña de red de las devtools
+    const serverTiming = searchResponse.headers.get('server-timing');
+    const timingHeaders = serverTiming ? { 'Server-Timing': serverTiming } : undefined;
+    if (serverTiming) {
+      console.log(`[DeepFace 512] Server-Timing: ${serverTiming}`);
     }
+    const candidates: Array<{
+      distance: number;
+      person: any;
+    }> = searchResult.candidates.map((candidate: any) => ({
+      distance: candidate.distance,
+      person: { ...candidate, full_name: candidate.person_name },
+    }));
 
-    if (!knownPeople || knownPeople.length === 0) {
+    if (candidates.length === 0) {
       console.log('[DeepFace 512] No profiles with 512-dim embeddings found');
       return NextResponse.json({
         match_found: false,
@@ -189,42 +113,10 @@ export async function POST(request: NextRequest) {
       });
     }
 
-    console.log(`[DeepFace 512] Comparing with ${knownPeople.length} profiles`);
-
-    // Paso 3: Calcular distancias a todos los perfiles
-    const candidates: Array<{
-      distance: number;
-      person: any;
-    }> = [];
-
-    for (const person of knownPeople) {
-      try {
-        // Priorizar face_encoding_deepface_512, sino usar face_encoding
-        const dbEmbedding = person.face_encoding_deepface_512 || person.face_encoding;
-        
-        if (!dbEmbedding || !Array.isArray(dbEmbedding)) {
-          continue;
-        }
-
-        // Validar dimensiones
-        if (dbEmbedding.length !== faceDescriptor.length) {
-          console.warn(`[DeepFace 512] Dimension mismatch for ${person.full_name}: DB=${dbEmbedding.length}, Target=${faceDescriptor.length}`);
-          continue;
-        }
-
-        const distance = calculateEuclideanDistance(faceDescriptor, dbEmbedding);
-        candidates.push({ distance, person });
-      } catch (error) {
-        console.error(`[DeepFace 512] Error comparing with ${person.full_name}:`, error);
-        continue;
-      }
-    }
-
-    // Ordenar por distancia (menor es mejor)
-    candidates.sort((a, b) => a.distance - b.distance);
+    console.log(`[DeepFace 512] Top ${candidates.length} candidates received (ambiguous: ${searchResult.ambiguous})`);
 
     const bestMatch = candidates[0];
-    const matchFound = bestMatch && bestMatch.distance < threshold;
+    const matchFound = searchResult.match_found;
 
     // Determinar nivel de confianza basado en distancia
     let confidence = 'Low';
@@ -259,7 +151,7 @@ export async function POST(request: NextRequest) {
         photo_path: bestMatch.person.photo_path,
         label: bestMatch.person.label,
         message: `Match encontrado: ${bestMatch.person.full_name}`,
-      });
+      }, { headers: timingHeaders });
     } else {
       // Devolver top 3 candidatos incluso si no hay match
       const topCandidates = candidates.slice(0, 3).map((candidate) => ({
@@ -271,21 +163,20 @@ export async function POST(request: NextRequest) {
         label: candidate.person.label,
       }));
 
-      const message = bestMatch
-        ? `No se encontró match. El más cercano fue ${bestMatch.person.full_name} con distancia ${bestMatch.distance.toFixed(4)}`
-        : 'No se encontraron coincidencias';
+      const message = searchResult.message;
 
       console.log(`[DeepFace 512] No match. ${message}`);
 
       return NextResponse.json({
         match_found: false,
+        ambiguous: searchResult.ambiguous,
         confidence,
         distance: bestMatch?.distance || null,
         candidates: topCandidates,
         method: 'deepface_512',
         threshold,
         message,
-      });
+      }, { headers: timingHeaders });
     }
   } catch (error) {
     console.error('[DeepFace 512] Error:', error);